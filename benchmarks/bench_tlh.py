@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Benchmark the assembly of the TLH tables (ordering the harvestable lots, deduping the wash sale rows, and
+summarizing), on synthetic lots. These steps should scale linearly with the number of lots: the time per lot
+reported below should stay roughly flat as the number of lots grows.
+
+To run: python benchmarks/bench_tlh.py [--max-lots 50000]
+"""
+
+import collections
+import datetime
+import os
+import random
+import sys
+import time
+import click
+from beancount.core.amount import Amount
+from beancount.core.inventory import Inventory
+from beancount.core.number import D
+from beancount.core.position import Cost
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from fava_investor.common.table import Table  # noqa: E402
+from fava_investor.modules.tlh import libtlh  # noqa: E402
+
+retrow_types = [('account', str), ('units', D), ('ticker', str), ('acquisition_date', datetime.date),
+                ('market_value', D), ('currency', str), ('loss', D), ('term', str), ('wash', str)]
+RetRow = collections.namedtuple('RetRow', [i[0] for i in retrow_types])
+
+
+def synthetic_tables(nlots, seed=0):
+    """Harvestable lots spread over nlots/20 tickers and 50 accounts (as years of DCA into many accounts
+    would produce), and the recent purchases of groups of 3 substantially identical tickers."""
+    rng = random.Random(seed)
+    tickers = [f'T{i:05d}' for i in range(max(1, nlots // 20))]
+    start = datetime.date(2015, 1, 1)
+
+    to_sell = []
+    for _ in range(nlots):
+        to_sell.append(RetRow(f'Account{rng.randrange(50)}', D(rng.randrange(1, 100)), rng.choice(tickers),
+                              start + datetime.timedelta(days=rng.randrange(3000)),
+                              D(rng.randrange(100, 10000)), 'USD', D(rng.randrange(1, 1000)), 'Long', ''))
+
+    # every ticker in a group maps to the group's (shared) rows, which is what build_recents() dedupes
+    rtypes = [('account', str), ('acquisition_date', datetime.date), ('earliest_sale', datetime.date),
+              ('units', Inventory), ('basis', Inventory)]
+    Row = collections.namedtuple('Row', [i[0] for i in rtypes])
+    recent_purchases = {}
+    for wash_id, i in enumerate(range(0, len(tickers), 3)):
+        group = tickers[i:i + 3]
+        rows = []
+        for t in group:
+            date = datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randrange(30))
+            units = Inventory()
+            units.add_amount(Amount(D(10), t), Cost(D(100), 'USD', date, None))
+            basis = Inventory()
+            basis.add_amount(Amount(D(1000), 'USD'))
+            rows.append(Row(f'Account{rng.randrange(50)}', date, date + datetime.timedelta(days=31), units, basis))
+        for t in group:
+            recent_purchases[t] = ((rtypes, rows), wash_id)
+
+    by_commodity_types = [('currency', str), ('total_loss', D), ('market_value', D), ('alt', str)]
+    ByCommodity = collections.namedtuple('ByCommodity', [i[0] for i in by_commodity_types])
+    losses = collections.defaultdict(D)
+    for r in to_sell:
+        losses[r.ticker] += r.loss
+    by_commodity = Table.from_rows(by_commodity_types, [ByCommodity(t, loss, D(0), '') for t, loss in
+                                                        sorted(losses.items(), key=lambda x: x[1], reverse=True)])
+    return Table.from_rows(retrow_types, to_sell), by_commodity, recent_purchases
+
+
+def assemble(harvestable_table, by_commodity, recent_purchases):
+    libtlh.summarize_tlh(harvestable_table, by_commodity)
+    libtlh.build_recents(recent_purchases)
+    libtlh.sort_harvestable_table(harvestable_table, by_commodity)
+
+
+@click.command()
+@click.option('--max-lots', default=50000, show_default=True, help='Largest number of lots to benchmark')
+def bench_tlh(max_lots):
+    """Time the assembly of the TLH tables on increasing numbers of synthetic lots."""
+    sizes = [n for n in [1000, 5000, 10000, 25000, 50000, 100000] if n <= max_lots]
+    click.echo(f"{'lots':>8} {'seconds':>10} {'us/lot':>8}")
+    per_lot = []
+    for nlots in sizes:
+        tables = synthetic_tables(nlots)
+        start = time.perf_counter()
+        assemble(*tables)
+        elapsed = time.perf_counter() - start
+        per_lot.append(elapsed / nlots)
+        click.echo(f'{nlots:>8} {elapsed:>10.3f} {elapsed / nlots * 1e6:>8.2f}')
+
+    # a quadratic step makes this ratio grow with the number of lots
+    click.echo(f'per lot time, largest vs smallest: {per_lot[-1] / per_lot[0]:.1f}x')
+
+
+if __name__ == '__main__':
+    bench_tlh()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""Generate synthetic Beancount ledgers for benchmarking.
+
+The ledger has a bank account and a number of taxable and tax-deferred brokerage accounts, commodities
+(arranged in groups of substantially identical funds) with asset allocation metadata, lots bought over the
+years, a few recent sales at a loss, and daily prices ending today. It carries a config for every module, so
+each of them has work to do on it.
+"""
+
+import datetime
+import random
+import click
+
+ASSET_CLASSES = ['Equity_Domestic', 'Equity_International', 'Bond_Municipal', 'Bond_Treasury', 'Realestate']
+
+
+def generate_ledger(f, accounts=10, commodities=50, lots=2000, years=5, group_size=3, seed=0, end=None):
+    """Write a synthetic ledger to the file object f. accounts is the number of brokerage accounts,
+    group_size the number of commodities in each group of substantially identical funds."""
+    rng = random.Random(seed)
+    end = end or datetime.date.today()
+    start = end - datetime.timedelta(days=365 * years)
+
+    w = f.write
+    w('option "title" "Synthetic benchmark ledger"\n')
+    w('option "operating_currency" "USD"\n\n')
+    w('''2000-01-01 custom "fava-extension" "fava_investor" "{
+  'tlh': {'accounts_pattern': 'Assets:Investments:Taxable', 'account_field': 'account',
+          'loss_threshold': 0, 'wash_pattern': 'Assets:Investments'},
+  'minimizegains': {'accounts_pattern': 'Assets:Investments:Taxable', 'account_field': 2,
+                    'st_tax_rate': 0.30, 'lt_tax_rate': 0.15},
+  'cashdrag': {'accounts_pattern': '^Assets', 'metadata_label_cash': 'asset_allocation_Bond_Cash'},
+  'asset_alloc_by_class': {'accounts_patterns': ['Assets:Investments']},
+  'asset_alloc_by_account': [{'title': 'By account', 'pattern_type': 'account_name',
+                              'pattern': 'Assets:Investments:.*'}],
+  'summarizer': [{'title': 'Commodities', 'directive_type': 'commodities', 'active_only': True,
+                  'col_labels': ['Ticker', 'Subst_Identicals', 'TLH_Partners', 'Name'],
+                  'columns': ['ticker', 'a__substidenticals', 'a__tlh_partners', 'name'], 'sort_by': 0},
+                 {'title': 'Accounts', 'directive_type': 'accounts', 'acc_pattern': '^Assets:Investments',
+                  'col_labels': ['Account', 'Phone'], 'columns': ['account', 'customer_service_phone'],
+                  'sort_by': 0}],
+}"\n\n''')
+
+    # commodities, in groups of substantially identical funds. Partners are the next group over
+    tickers = [f'T{i:04d}' for i in range(commodities)]
+    groups = [tickers[i:i + group_size] for i in range(0, commodities, group_size)]
+    w('1792-01-01 commodity USD\n  asset_allocation_Bond_Cash: 100\n\n')
+    for gi, group in enumerate(groups):
+        partners = groups[(gi + 1) % len(groups)]
+        asset_class = ASSET_CLASSES[gi % len(ASSET_CLASSES)]
+        for t in group:
+            w(f'2000-01-01 commodity {t}\n')
+            w(f'  name: "Synthetic fund {t}"\n')
+            w(f'  asset_allocation_{asset_class}: 100\n')
+            identicals = [i for i in group if i != t]
+            if identicals:
+                w(f'  a__substidenticals: "{",".join(identicals)}"\n')
+            w(f'  a__tlh_partners: "{",".join(partners)}"\n\n')
+
+    brokerages = [f'Assets:Investments:{rng.choice(["Taxable", "Tax-Deferred"])}:Broker{i}' for i in range(accounts)]
+    w('2000-01-01 open Assets:Bank\n2000-01-01 open Income:Gains\n')
+    for b in brokerages:
+        w(f'2000-01-01 open {b}\n  customer_service_phone: "1-555-{rng.randrange(1000, 10000)}"\n')
+    w('\n')
+
+    # daily prices: a random walk per commodity
+    prices = {}
+    for t in tickers:
+        price = rng.uniform(20, 200)
+        series = []
+        for d in range((end - start).days + 1):
+            price = max(1.0, price * (1 + rng.gauss(0.0002, 0.01)))
+            series.append(round(price, 2))
+        prices[t] = series
+
+    # lots, with a tenth of them in the last 30 days (for wash sales), and sales at a loss in the last 30 days
+    ndays = (end - start).days
+    entries = []
+    for _ in range(lots):
+        t = rng.choice(tickers)
+        account = rng.choice(brokerages)
+        day = rng.randrange(max(0, ndays - 30), ndays + 1) if rng.random() < 0.1 else rng.randrange(ndays + 1)
+        date = start + datetime.timedelta(days=day)
+        units = rng.randrange(1, 100)
+        cost = prices[t][day]
+        entries.append((date, f'{date} * "Buy {t}"\n  {account} {units} {t} {{{cost} USD}}\n  Assets:Bank\n\n'))
+
+        sale_day = rng.randrange(max(day + 1, ndays - 30), ndays + 1) if day < ndays else None
+        if sale_day is not None and rng.random() < 0.05 and prices[t][sale_day] < cost:
+            sale_date = start + datetime.timedelta(days=sale_day)
+            proceeds = units * prices[t][sale_day]
+            entries.append((sale_date, f'{sale_date} * "Sell {t}"\n'
+                                       f'  {account} -{units} {t} {{{cost} USD, {date}}} @ {prices[t][sale_day]} USD\n'
+                                       f'  Assets:Bank {proceeds:.2f} USD\n  Income:Gains\n\n'))
+
+    for d in range(ndays + 1):
+        date = start + datetime.timedelta(days=d)
+        entries.append((date, ''.join(f'{date} price {t} {prices[t][d]} USD\n' for t in tickers)))
+
+    entries.sort(key=lambda e: e[0])
+    for _, text in entries:
+        w(text)
+
+
+@click.command()
+@click.argument('output', type=click.File('w'))
+@click.option('--accounts', default=10, show_default=True, help='Number of brokerage accounts')
+@click.option('--commodities', default=50, show_default=True, help='Number of commodities')
+@click.option('--lots', default=2000, show_default=True, help='Number of purchases')
+@click.option('--years', default=5, show_default=True, help='Years of daily prices and purchases')
+@click.option('--group-size', default=3, show_default=True, help='Commodities per substantially identical group')
+@click.option('--seed', default=0, show_default=True)
+def genledger(output, accounts, commodities, lots, years, group_size, seed):
+    """Write a synthetic Beancount ledger to OUTPUT."""
+    generate_ledger(output, accounts, commodities, lots, years, group_size, seed)
+
+
+if __name__ == '__main__':
+    genledger()
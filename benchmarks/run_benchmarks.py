@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Time every module's library entry point on a synthetic ledger, reporting wall time and peak memory.
+
+To catch regressions in hot paths, save a run on a known good tree, and compare later runs to it:
+
+    python benchmarks/run_benchmarks.py --save baseline.json
+    python benchmarks/run_benchmarks.py --compare baseline.json
+"""
+
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import click
+from beancount import loader
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.dirname(__file__))
+import fava_investor.common.beancountinvestorapi as api  # noqa: E402
+from fava_investor.modules.tlh import libtlh  # noqa: E402
+from fava_investor.modules.assetalloc_class import libassetalloc  # noqa: E402
+from fava_investor.modules.cashdrag import libcashdrag  # noqa: E402
+from fava_investor.modules.summarizer import libsummarizer  # noqa: E402
+from fava_investor.modules.minimizegains import libminimizegains  # noqa: E402
+from genledger import generate_ledger  # noqa: E402
+
+# ledger sizes: arguments to generate_ledger()
+SIZES = {
+    'small': dict(accounts=5, commodities=20, lots=500, years=2),
+    'medium': dict(accounts=10, commodities=50, lots=2000, years=5),
+    'large': dict(accounts=40, commodities=200, lots=20000, years=10),
+}
+
+# name -> (module config key, default config, entry point). Same as in fava_investor.Investor, except for
+# assetalloc_account, which needs Fava (AccAPI does not implement cost_or_value())
+SCENARIOS = {
+    'assetalloc_class': ('asset_alloc_by_class', {}, libassetalloc.assetalloc),
+    'cashdrag': ('cashdrag', {}, libcashdrag.find_loose_cash),
+    'summarizer': ('summarizer', {}, libsummarizer.build_tables),
+    'tlh': ('tlh', {}, libtlh.get_tables),
+    'tlh_recently_sold': ('tlh', {}, libtlh.recently_sold_at_loss),
+    'minimizegains': ('minimizegains', {}, libminimizegains.find_minimized_gains),
+}
+
+
+def measure(func, repeat):
+    """Return (best wall time in seconds, peak memory in MiB) of func(). Peak memory is measured on a separate
+    run, since tracing allocations slows everything down."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak / 2**20
+
+
+def run(ledger, scenarios, repeat):
+    # time parsing the ledger, rather than reading beancount's pickle cache of it (written after the first run)
+    loader.initialize(use_cache=False)
+    results = {}
+    results['load'] = measure(lambda: api.AccAPI(ledger, {}), repeat)
+    accapi = api.AccAPI(ledger, {})
+
+    for name in scenarios:
+        config_key, default, func = SCENARIOS[name]
+        config = accapi.get_custom_config(config_key) or default
+
+        def scenario():
+            accapi.results.clear()  # don't let memoized lots or price maps carry over between runs
+            func(accapi, config)
+        results[name] = measure(scenario, repeat)
+    return results
+
+
+@click.command()
+@click.option('--ledger', type=click.Path(exists=True), help='Benchmark this ledger instead of a synthetic one')
+@click.option('--size', type=click.Choice(list(SIZES)), default='medium', show_default=True,
+              help='Size of the synthetic ledger')
+@click.option('--scenario', 'scenarios', multiple=True, type=click.Choice(list(SCENARIOS)),
+              help='Scenarios to run (default: all). Can be repeated')
+@click.option('--repeat', default=3, show_default=True, help='Report the best of this many runs')
+@click.option('--save', type=click.File('w'), help='Save the results as json')
+@click.option('--compare', type=click.File('r'), help='Compare against results saved earlier with --save')
+@click.option('--tolerance', default=0.25, show_default=True,
+              help='With --compare, report scenarios slower (or larger) than this fraction as regressions')
+def run_benchmarks(ledger, size, scenarios, repeat, save, compare, tolerance):
+    """Benchmark the fava_investor modules, reporting wall time and peak memory per scenario."""
+    scenarios = scenarios or list(SCENARIOS)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if not ledger:
+            ledger = os.path.join(tmpdir, 'synthetic.beancount')
+            with open(ledger, 'w') as f:
+                generate_ledger(f, **SIZES[size])
+        results = run(ledger, scenarios, repeat)
+
+    baseline = json.load(compare) if compare else {}
+    regressions = []
+    click.echo(f"{'scenario':20} {'seconds':>10} {'peak MiB':>10}" + (f" {'vs base':>10}" if baseline else ''))
+    for name, (seconds, peak) in results.items():
+        line = f'{name:20} {seconds:>10.3f} {peak:>10.1f}'
+        if name in baseline:
+            base_seconds, base_peak = baseline[name]
+            line += f' {seconds / base_seconds:>9.2f}x'
+            if seconds > base_seconds * (1 + tolerance) or peak > base_peak * (1 + tolerance):
+                regressions.append(name)
+                line += '  REGRESSION'
+        click.echo(line)
+
+    if save:
+        json.dump(results, save, indent=2)
+    if regressions:
+        raise click.ClickException(f"Regressions in: {', '.join(regressions)}")
+
+
+if __name__ == '__main__':
+    run_benchmarks()
@@ -1,6 +1,8 @@
 """Fava Investor: Investing related reports and tools for Beancount/Fava"""
 
+import datetime
 from fava.ext import FavaExtensionBase
+from flask import request
 
 from .modules.tlh import libtlh
 from .modules.assetalloc_class import libassetalloc
@@ -9,47 +11,71 @@ from .modules.cashdrag import libcashdrag
 from .modules.summarizer import libsummarizer
 from .modules.minimizegains import libminimizegains
 from .common.favainvestorapi import FavaInvestorAPI
+from .common.resultcache import ResultCache
 
 
 class Investor(FavaExtensionBase):  # pragma: no cover
     report_title = "Investor"
 
+    def __init__(self, ledger, config=None):
+        super().__init__(ledger, config)
+        self.results = ResultCache(maxsize=32)
+
+    def after_load_file(self):
+        self.results.clear()
+        FavaInvestorAPI.results.clear()
+        FavaInvestorAPI.price_maps.clear()
+
+    def before_request(self):
+        # Profile this request if asked to (add 'profile=1' to the url). See profile_table()
+        FavaInvestorAPI.profiler.clear()
+        FavaInvestorAPI.profiler.enabled = bool(request.args.get('profile'))
+        if FavaInvestorAPI.profiler.enabled:
+            # profile the work a first render does, rather than cache hits from earlier renders
+            self.after_load_file()
+
+    def profile_table(self):
+        """Timings of the module builders and accapi calls made so far in this request"""
+        return FavaInvestorAPI.profiler.table()
+
+    def cached(self, builder, config_key, default):
+        """Run builder(accapi, config), reusing the result from a previous render if the ledger, the active
+        Fava filters, the module config, and today's date (TLH looks back from TODAY()) are all unchanged."""
+        accapi = FavaInvestorAPI()
+        config = self.config.get(config_key, default)
+        key = (builder.__module__, builder.__name__, accapi.cache_key(), repr(config), datetime.date.today())
+        with accapi.profiler.timer(builder.__name__):
+            return self.results.lookup(key, lambda: builder(accapi, config))
+
     # AssetAllocClass
     # -----------------------------------------------------------------------------------------------------------
     def build_assetalloc_by_class(self):
-        accapi = FavaInvestorAPI()
-        return libassetalloc.assetalloc(accapi, self.config.get('asset_alloc_by_class', {}))
+        return self.cached(libassetalloc.assetalloc, 'asset_alloc_by_class', {})
 
     # AssetAllocAccount
     # -----------------------------------------------------------------------------------------------------------
     def build_aa_by_account(self):
-        accapi = FavaInvestorAPI()
-        return libaaacc.portfolio_accounts(accapi, self.config.get('asset_alloc_by_account', []))
+        return self.cached(libaaacc.portfolio_accounts, 'asset_alloc_by_account', [])
 
     # Cash Drag
     # -----------------------------------------------------------------------------------------------------------
     def build_cashdrag(self):
-        accapi = FavaInvestorAPI()
-        return libcashdrag.find_loose_cash(accapi, self.config.get('cashdrag', {}))
+        return self.cached(libcashdrag.find_loose_cash, 'cashdrag', {})
 
     # Summarizer (metadata info)
     # -----------------------------------------------------------------------------------------------------------
     def build_summarizer(self):
-        accapi = FavaInvestorAPI()
-        return libsummarizer.build_tables(accapi, self.config.get('summarizer', {}))
+        return self.cached(libsummarizer.build_tables, 'summarizer', {})
 
     # TaxLossHarvester
     # -----------------------------------------------------------------------------------------------------------
     def build_tlh_tables(self):
-        accapi = FavaInvestorAPI()
-        return libtlh.get_tables(accapi, self.config.get('tlh', {}))
+        return self.cached(libtlh.get_tables, 'tlh', {})
 
     # Gains Minimizer
     # -----------------------------------------------------------------------------------------------------------
     def build_minimizegains(self):
-        accapi = FavaInvestorAPI()
-        return libminimizegains.find_minimized_gains(accapi, self.config.get('minimizegains', {}))
+        return self.cached(libminimizegains.find_minimized_gains, 'minimizegains', {})
 
     def recently_sold_at_loss(self):
-        accapi = FavaInvestorAPI()
-        return libtlh.recently_sold_at_loss(accapi, self.config.get('tlh', {}))
+        return self.cached(libtlh.recently_sold_at_loss, 'tlh', {})
@@ -2,6 +2,10 @@
 """Main command line interface for investor"""
 
 import click
+import concurrent.futures
+import multiprocessing
+import fava_investor.common.beancountinvestorapi as api
+from fava_investor.common.clicommon import pretty_print_table
 # import fava_investor.modules.assetalloc_account as assetalloc_account
 import fava_investor.modules.assetalloc_class.assetalloc_class as assetalloc_class
 import fava_investor.modules.cashdrag.cashdrag as cashdrag
@@ -11,8 +15,17 @@ import fava_investor.modules.minimizegains.minimizegains as minimizegains
 
 
 @click.group()
-def cli():
-    pass
+@click.option('--profile', is_flag=True, help='Print the time spent in queries, price maps, etc. when done')
+@click.pass_context
+def cli(ctx, profile):
+    if profile:
+        api.AccAPI.profiler.enabled = True
+        ctx.call_on_close(print_profile)
+
+
+def print_profile():
+    rtypes, rrows, _, footer = api.AccAPI.profiler.table()
+    click.echo(pretty_print_table('Profile', rtypes, rrows, footer), err=True)
 
 
 # cli.add_command(assetalloc_account.assetalloc_account)
@@ -23,5 +36,63 @@ cli.add_command(tlh.tlh)
 cli.add_command(minimizegains.minimizegains)
 
 
+# Modules the report command can run, by the name of their subcommand
+report_modules = {
+    'assetalloc-class': assetalloc_class.gen_output,
+    'cashdrag': cashdrag.gen_output,
+    'minimizegains': minimizegains.gen_output,
+    'summarizer': summarizer.gen_output,
+    'tlh': tlh.gen_output,
+}
+
+# Ledger of a forked report worker, set by init_report_worker()
+_worker_accapi = None
+
+
+def init_report_worker(accapi):
+    """Runs in each worker. With fork(), accapi is inherited rather than pickled, so workers don't reload it"""
+    global _worker_accapi
+    _worker_accapi = accapi
+
+
+def run_report_module(accapi, module):
+    with accapi.profiler.timer(module):
+        return ''.join(report_modules[module](accapi))
+
+
+def run_report_module_in_worker(module):
+    return run_report_module(_worker_accapi, module)
+
+
+@cli.command()
+@click.argument('beancount-file', type=click.Path(exists=True), envvar='BEANCOUNT_FILE')
+@click.option('--modules', default='tlh,minimizegains,cashdrag,summarizer,assetalloc-class', show_default=True,
+              help='Comma-separated list of modules to run, in output order')
+@click.option('-j', '--jobs', default=1, show_default=True,
+              help='Run up to this many modules in parallel (requires fork(), ie: not on Windows). With '
+              '--profile, only the ledger load is profiled, since modules run in other processes')
+def report(beancount_file, modules, jobs):
+    """Run several modules against a single load of the ledger, and output all their tables together.
+
+       The BEANCOUNT_FILE environment variable can optionally be set instead of specifying the file on the
+       command line. Each module reads its configuration from the ledger, exactly as its own subcommand does.
+    """
+    modules = modules.split(',')
+    unknown = [m for m in modules if m not in report_modules]
+    if unknown:
+        raise click.BadParameter(f"unknown module(s): {', '.join(unknown)}. "
+                                 f"Choose from: {', '.join(report_modules)}", param_hint='--modules')
+
+    accapi = api.AccAPI(beancount_file, {})
+    # all output is generated before paging, so that errors are reported on their own, not inside the pager
+    if jobs > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context('fork'),
+                                                    initializer=init_report_worker, initargs=(accapi,)) as executor:
+            outputs = list(executor.map(run_report_module_in_worker, modules))
+    else:
+        outputs = [run_report_module(accapi, m) for m in modules]
+    click.echo_via_pager(outputs)
+
+
 if __name__ == '__main__':
     cli()
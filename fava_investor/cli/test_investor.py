@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+
+import os
+import unittest
+from unittest import mock
+from click.testing import CliRunner
+from fava_investor.cli import investor
+
+example = os.path.join(os.path.dirname(__file__), '..', 'modules', 'tlh', 'example.beancount')
+
+
+class TestReport(unittest.TestCase):
+    def test_parallel_report_matches_serial(self):
+        runner = CliRunner()
+        args = ['report', example, '--modules', 'tlh,cashdrag,summarizer']
+        serial = runner.invoke(investor.cli, args)
+        parallel = runner.invoke(investor.cli, args + ['--jobs', '2'])
+
+        self.assertEqual(0, parallel.exit_code, parallel.output)
+        self.assertIn('Losses by commodity', parallel.output)
+        self.assertEqual(serial.output, parallel.output)
+
+    def test_module_error_not_paged(self):
+        def failing(accapi):
+            yield 'partial output'
+            raise RuntimeError('module failed')
+
+        modules = dict(investor.report_modules, tlh=failing)
+        with mock.patch.dict(investor.report_modules, modules):
+            result = CliRunner().invoke(investor.cli, ['report', example, '--modules', 'cashdrag,tlh', '--jobs', '2'])
+
+        self.assertIsInstance(result.exception, RuntimeError)
+        self.assertEqual('', result.output)
@@ -1,39 +1,68 @@
 #!/usr/bin/env python3
 
-from collections import namedtuple
+import os
 from beancount.core import convert
 from beancount import loader
 from beancount.core import getters
 from beancount.core import prices
 from beancount.core import realization
-from beanquery import query
+import beanquery
 from beancount.core.data import Open
 from beancount.core.data import Custom
+from fava_investor.common.resultcache import ResultCache
+from fava_investor.common.profiler import Profiler, profiled
+from fava_investor.common import querycache
+from fava_investor.common.libinvestor import QueryResult
 import ast
 
 
 class AccAPI:
+    # Shared across instances, so that the CLI's --profile covers every AccAPI a command creates
+    profiler = Profiler()
+
     def __init__(self, beancount_file, options):
-        self.entries, _, self.options_map = loader.load_file(beancount_file)
+        self.beancount_file = os.path.abspath(beancount_file)
+        with self.profiler.timer('load_file'):
+            # beancount caches slow loads in .<file>.picklecache (unless BEANCOUNT_DISABLE_LOAD_CACHE is set)
+            self.entries, _, self.options_map = loader.load_file(beancount_file)
         self.options = options
         self.convert_position = convert.convert_position
+        self.results = ResultCache(maxsize=64)
+
+    def memoize(self, key, compute):
+        """Results derived from the ledger are computed once per AccAPI, since the entries never change.
+        key is a name, or a tuple starting with one. self.results.hit_counts[name] counts avoided rebuilds."""
+        name = key if isinstance(key, str) else key[0]
+        return self.results.lookup(key, compute, name)
+
+    def source_key(self):
+        """Identify the ledger across loads (see liblots.get_lots())"""
+        return (self.beancount_file,)
 
     def end_date(self):
         return None  # Only used in fava (UI selection context)
 
+    @profiled
     def build_price_map(self):
-        return prices.build_price_map(self.entries)
+        return self.memoize('price_map', lambda: prices.build_price_map(self.entries))
 
+    @profiled
     def build_beancount_price_map(self):
         return self.build_price_map()
 
+    @profiled
     def build_filtered_price_map(self, pos, base_currency):
         """Ignore filtering since we are not in fava. Return all prices"""
-        return prices.build_price_map(self.entries)
+        return self.build_price_map()
+
+    def get_entries(self):
+        return self.entries
 
+    @profiled
     def get_commodity_directives(self):
         return getters.get_commodity_directives(self.entries)
 
+    @profiled
     def realize(self):
         return realization.realize(self.entries)
 
@@ -45,15 +74,19 @@ class AccAPI:
         # import pdb; pdb.set_trace()
         # return realization.realize(self.entries)
 
-    def query_func(self, sql):
-        rtypes, rrows = query.run_query(self.entries, self.options_map, sql)
-
-        # Convert this into Beancount v2 format, so the rows are namedtuples
-        field_names = [t.name for t in rtypes]
-        rtypes = [(t.name, t.datatype) for t in rtypes]
-        Row = namedtuple("Row", field_names)
-        rrows = [Row(*row) for row in rrows]
-        return rtypes, rrows
+    @profiled
+    def query_func(self, sql, params=None):
+        """Run sql, with the %(name)s placeholders in it bound to the values in params. See querycache.
+        Returns (rtypes, rows), with rows as namedtuples."""
+        result = self.query_table(sql, params)
+        return result.rtypes, list(result)
+
+    @profiled
+    def query_table(self, sql, params=None):
+        """Like query_func(), but returns a QueryResult, which doesn't copy the rows."""
+        connection = self.memoize('bql_connection', lambda: beanquery.connect(
+            'beancount:', entries=self.entries, errors=[], options=self.options_map))
+        return QueryResult.from_cursor(connection.execute(querycache.parse(sql), params))
 
     def get_operating_currencies(self):
         return self.options_map['operating_currency']
@@ -4,13 +4,14 @@
 import click
 import csv
 import tabulate
+from fava_investor.common.table import Table
 tabulate.PRESERVE_WHITESPACE = True
 
 
 def pretty_print_table(title, rtypes, rrows, footer=None, **kwargs):
     title_out = click.style(title + '\n', bg='green', fg='white')
     if footer:
-        rrows += [(i[1] for i in footer)]
+        rrows = rrows + [(i[1] for i in footer)]
 
     if rrows:
         headers = [i[0] for i in rtypes]
@@ -28,6 +29,9 @@ def pretty_print_table_bare(rrows):
 def write_table_csv(filename, table):
     """ Write table to csv file """
     with open(filename, 'w') as csvfile:
+        if isinstance(table[1], Table):
+            table[1].write_csv(csvfile)
+            return
         writer = csv.writer(csvfile)
         headers = [i[0] for i in table[1][0]]
         writer.writerow(headers)
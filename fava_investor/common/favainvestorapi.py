@@ -1,58 +1,109 @@
 from beancount.core import getters
-from collections import namedtuple
 from fava.core.conversion import cost_or_value as cost_or_value_without_context
 from fava import __version__ as fava_version
 from packaging import version
 from fava.context import g
+from flask import request
+from fava_investor.common.resultcache import ResultCache
+from fava_investor.common.profiler import Profiler, profiled
 from fava.core.conversion import convert_position
 from beancount.core import realization
 from beancount.core import prices
-from beanquery import query
+import beanquery
+from fava_investor.common import querycache
+from fava_investor.common.libinvestor import QueryResult
 
 
 class FavaInvestorAPI:
+    # Shared across instances, since a new FavaInvestorAPI is created for every module call
+    results = ResultCache(maxsize=64)
+    # One entry per (commodity, base currency) looked up. Kept apart from results, so that a ledger with many
+    # commodities doesn't evict the shared results (lots, query connection, price map) from it
+    price_maps = ResultCache(maxsize=1024)
+    profiler = Profiler()
+
     def __init__(self):
         self.convert_position = convert_position
 
+    @profiled
     def build_price_map(self):
         return g.ledger.prices
 
+    @profiled
     def build_beancount_price_map(self):
-        return prices.build_price_map(g.ledger.all_entries)
+        """Built from all (unfiltered) entries, so this is shared across filter selections."""
+        return self.results.lookup((self.ledger_key(), 'beancount_price_map'),
+                                   lambda: prices.build_price_map(g.ledger.all_entries), 'beancount_price_map')
 
+    @profiled
     def build_filtered_price_map(self, pcur, base_currency):
         """pcur and base_currency are currency strings"""
-        return {(pcur, base_currency): g.filtered.prices(pcur, base_currency)}
+        return self.price_maps.lookup((self.cache_key(), pcur, base_currency),
+                                      lambda: {(pcur, base_currency): g.filtered.prices(pcur, base_currency)},
+                                      'filtered_price_map')
 
     def end_date(self):
         return g.filtered.end_date
 
+    def ledger_key(self):
+        """Identify the ledger load"""
+        return (g.ledger.beancount_file_path, g.ledger.mtime)
+
+    def filter_key(self):
+        return tuple(request.args.get(f, '') for f in ['account', 'filter', 'time', 'conversion'])
+
+    def cache_key(self):
+        """Identify the ledger load and the active Fava filters. Results computed from this API can be
+        reused for as long as this key stays the same."""
+        return self.ledger_key() + self.filter_key()
+
+    def source_key(self):
+        """Like cache_key(), but stays the same across reloads of the ledger"""
+        return (g.ledger.beancount_file_path,) + self.filter_key()
+
+    def memoize(self, key, compute):
+        """Compute once per ledger load and Fava filter selection. key is a name, or a tuple starting with
+        one. self.results.hit_counts[name] counts avoided rebuilds."""
+        name = key if isinstance(key, str) else key[0]
+        return self.results.lookup((self.cache_key(), key), compute, name)
+
+    def get_entries(self):
+        return g.filtered.entries
+
+    @profiled
     def get_commodity_directives(self):
         return {entry.currency: entry for entry in g.filtered.ledger.all_entries_by_type.Commodity}
 
+    @profiled
     def realize(self):
         return realization.realize(g.filtered.entries)
 
     def root_tree(self):
         return g.filtered.root_tree
 
-    def query_func(self, sql):
+    @profiled
+    def query_func(self, sql, params=None):
+        """Run sql, with the %(name)s placeholders in it bound to the values in params. See querycache.
+        Returns (rtypes, rows), with rows as namedtuples."""
+        result = self.query_table(sql, params)
+        return result.rtypes, list(result)
+
+    @profiled
+    def query_table(self, sql, params=None):
+        """Like query_func(), but returns a QueryResult, which doesn't copy the rows."""
         # Based on the fava version, determine if we need to add a new
         # positional argument to fava's execute_query()
         if version.parse(fava_version) >= version.parse("1.30"):
-            rtypes, rrows = query.run_query(g.filtered.entries, g.ledger.options, sql)
-
-            # Convert this into Beancount v2 format, so the rows are namedtuples
-            field_names = [t.name for t in rtypes]
-            Row = namedtuple("Row", field_names)
-            rtypes = [(t.name, t.datatype) for t in rtypes]
-            rrows = [Row(*row) for row in rrows]
+            connection = self.memoize('bql_connection', lambda: beanquery.connect(
+                'beancount:', entries=g.filtered.entries, errors=[], options=g.ledger.options))
+            return QueryResult.from_cursor(connection.execute(querycache.parse(sql), params))
 
-        elif version.parse(fava_version) >= version.parse("1.22"):
+        sql = querycache.format_params(sql, params)
+        if version.parse(fava_version) >= version.parse("1.22"):
             _, rtypes, rrows = g.ledger.query_shell.execute_query(g.filtered.entries, sql)
         else:
             _, rtypes, rrows = g.ledger.query_shell.execute_query(sql)
-        return rtypes, rrows
+        return QueryResult(rtypes, rrows)
 
     def get_operating_currencies(self):
         return g.ledger.options["operating_currency"]  # TODO: error check
@@ -2,9 +2,12 @@
 
 import collections
 import decimal
+import functools
+import operator
 from beancount.core.inventory import Inventory
 from beancount.core import convert  # noqa: F401
-from beancount.core.convert import convert_position
+from beancount.core.amount import Amount
+from beancount.core.convert import convert_amount
 
 
 class Node(object):
@@ -44,6 +47,54 @@ def val(inv):
     return None
 
 
+@functools.lru_cache(maxsize=256)
+def row_type(field_names):
+    """namedtuple class for a tuple of field names. Created once per set of names, instead of once per
+    query or table."""
+    return collections.namedtuple('Row', field_names)
+
+
+class ColumnView:
+    """Read-only sequence of one column of a list of rows, without copying it out of the rows."""
+
+    def __init__(self, rows, idx):
+        self.rows = rows
+        self.idx = idx
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        return self.rows[i][self.idx]
+
+    def __iter__(self):
+        return map(operator.itemgetter(self.idx), self.rows)
+
+
+class QueryResult:
+    """Result of a query: rtypes (a list of (name, type)), and rows as returned by the query engine (plain
+    tuples). Rows are not copied: column() returns a view, and iterating converts one row at a time into a
+    namedtuple (see row_type()). Use this over query_func() for large results."""
+
+    def __init__(self, rtypes, rows):
+        self.rtypes = rtypes
+        self.rows = rows
+        self.index = {name: i for i, (name, _) in enumerate(rtypes)}
+
+    @classmethod
+    def from_cursor(cls, cursor):
+        return cls([(c.name, c.datatype) for c in cursor.description], cursor.fetchall())
+
+    def column(self, name):
+        return ColumnView(self.rows, self.index[name])
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return map(row_type(tuple(self.index))._make, self.rows)
+
+
 def remove_column(col_name, rows, types):
     """Remove a column by name from a beancount query return pair of rows and types"""
     try:
@@ -53,12 +104,8 @@ def remove_column(col_name, rows, types):
     idx = types.index(col)
 
     del types[idx]
-    RetRow = collections.namedtuple('RetRow', [i[0] for i in types])
-    rrows = []
-    for r in rows:
-        tmp = list(r)
-        del tmp[idx]
-        rrows.append(RetRow(*tmp))
+    RetRow = row_type(tuple(i[0] for i in types))
+    rrows = [RetRow._make(r[:idx] + r[idx + 1:]) for r in rows]
     return rrows, types
 
 
@@ -78,26 +125,43 @@ def insert_column(cols, col_name, col_type, new_col_name, new_col_type=str):
     return retval
 
 
-def build_table_footer(types, rows, accapi):
+def build_table_footer(types, rows, accapi, price_map=None):
     """Build a footer with sums by default. Looks like: [(<type>, <val>), ...]"""
+    columns = list(zip(*rows)) if rows else [() for _ in types]
+    return build_columns_footer(types, columns, accapi, price_map)
+
+
+def sum_inventories_converted(invs, target_currency, price_map):
+    """Sum the given inventories into a single inventory, converted to target_currency where a price is
+    available (as Inventory.reduce(convert_position, ...) would). Units are totalled by (currency, cost
+    currency) first, so each is converted once, rather than once per position."""
+    totals = {}
+    for inv in invs:
+        for pos in inv:
+            key = (pos.units.currency, pos.cost.currency if pos.cost else None)
+            totals[key] = totals.get(key, 0) + pos.units.number
+
+    retval = Inventory()
+    for (currency, cost_currency), number in totals.items():
+        retval.add_amount(convert_amount(Amount(number, currency), target_currency, price_map,
+                                         via=(cost_currency,)))
+    return retval
+
 
-    def sum_inventories(invs):
-        """Sum the given list of inventory into a single inventory"""
-        retval = Inventory()
-        for i in invs:
-            retval.add_inventory(i)
-        return retval
+def build_columns_footer(types, columns, accapi, price_map=None):
+    """Like build_table_footer(), but from columns: one sequence of values for each column in types. Pass
+    price_map if the caller already has one, to avoid fetching it again."""
 
     ret_types = [t[1] for t in types]
     ret_values = []
-    for label, t in types:
+    for (label, t), column in zip(types, columns):
         total = ''
         if t == Inventory:
-            total = sum_inventories([getattr(r, label) for r in rows])
-            total = total.reduce(convert_position, accapi.get_operating_currencies()[0],
-                                 accapi.build_beancount_price_map())
+            if price_map is None:
+                price_map = accapi.build_beancount_price_map()
+            total = sum_inventories_converted(column, accapi.get_operating_currencies()[0], price_map)
         elif t == decimal.Decimal:
-            total = sum([getattr(r, label) for r in rows])
+            total = sum(column)
         ret_values.append(total)
     return list(zip(ret_types, ret_values))
 
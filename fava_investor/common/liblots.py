@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""Table of open lots shared by the modules that work on individual lots (tlh, minimizegains).
+
+The lots are fetched with a single query, converted once into plain columns, and memoized on the accapi,
+so every module that needs them reads the same table instead of re-running and re-parsing its own query.
+
+With the 'incremental' option, the table from the previous load of the ledger is kept, and on a reload, only
+the lots of tickers that received new (or edited) transactions or prices are queried again.
+"""
+
+import collections
+import datetime
+import itertools
+import re
+from beancount.core.data import Price, Transaction
+from fava_investor.common.libinvestor import val, split_currency
+from fava_investor.common.resultcache import ResultCache
+
+# (accapi.source_key(), account_field, accounts_pattern, base_currency) -> (fingerprints, LotTable).
+# Unlike the memoized results, this outlives reloads of the ledger.
+lot_history = ResultCache(maxsize=8)
+
+LOT_COLUMNS = ['account', 'ticker', 'units', 'acquisition_date', 'market_value', 'currency', 'basis',
+               'cost_currency', 'market_value_base', 'currency_base', 'basis_base']
+Lot = collections.namedtuple('Lot', LOT_COLUMNS)
+
+
+class LotTable:
+    """Columnar table of lots: one list per column in LOT_COLUMNS, all of the same length.
+
+    market_value_base and basis_base are converted to base_currency (the first operating currency), and
+    currency_base is the currency they ended up in (the lot's own currency when no price is available to
+    convert it). All three are None when the ledger declares no operating currency."""
+
+    def __init__(self, base_currency=None):
+        self.base_currency = base_currency
+        self.columns = {c: [] for c in LOT_COLUMNS}
+        self.sortkeys = []  # the query's sort order, to merge in lots that are queried again
+
+    def append(self, sortkey, *values):
+        self.sortkeys.append(sortkey)
+        for c, v in zip(LOT_COLUMNS, values):
+            self.columns[c].append(v)
+
+    def column(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.columns['account'])
+
+    def __iter__(self):
+        return map(Lot._make, zip(*(self.columns[c] for c in LOT_COLUMNS)))
+
+
+def get_account_field(options):
+    """See modules/tlh/README.md"""
+    account_field = options.get('account_field', 'LEAF(account)')
+    try:
+        if isinstance(account_field, int):
+            account_field = ['account',
+                             'LEAF(account)',
+                             'GREPN("(.*):([^:]*):", account, 2)'  # get one-but-leaf account
+                             ][account_field]
+    except ValueError:
+        pass
+    return account_field
+
+
+def build_lot_table(accapi, account_field, accounts_pattern, tickers=None):
+    """Query the lots in accounts_pattern. If tickers is given, query only the lots of those tickers."""
+    operating_currencies = accapi.get_operating_currencies()
+    base_currency = operating_currencies[0] if operating_currencies else None
+    converted = """CONVERT(value(sum(position)), %(base_currency)s) as market_value_base,
+        CONVERT(cost(sum(position)), %(base_currency)s) as basis_base,""" if base_currency else ''
+    # the ticker filter goes first, so that the other conditions are only evaluated for those tickers
+    tickers_sql = "currency ~ %(tickers)s AND" if tickers else ''
+    params = {'base_currency': base_currency,
+              'accounts_pattern': accounts_pattern,
+              'tickers': '^({})$'.format('|'.join(re.escape(t) for t in sorted(tickers or [])))}
+
+    sql = f"""
+    SELECT {account_field} as account,
+        account_sortkey(account) as sortkey,
+        units(sum(position)) as units,
+        cost_date as acquisition_date,
+        {converted}
+        value(sum(position)) as market_value,
+        cost(sum(position)) as basis
+      WHERE {tickers_sql}
+        account_sortkey(account) ~ "^[01]" AND
+        account ~ %(accounts_pattern)s
+      GROUP BY {account_field}, cost_date, currency, cost_currency, cost_number, account_sortkey(account)
+      ORDER BY account_sortkey(account), currency, cost_date
+    """
+    result = accapi.query_table(sql, params)
+    col = result.column
+    if base_currency:
+        converted = zip(col('market_value_base'), col('basis_base'))
+    else:
+        converted = itertools.repeat((None, None))
+
+    # Since we GROUP BY cost_date, currency, cost_currency, cost_number, we never expect any of the
+    # inventories we get to have more than a single position. Thus, we can and should use
+    # get_only_position() below. We do this grouping because we are interested in seeing every lot (price,
+    # date) seperately
+    table = LotTable(base_currency)
+    for (sortkey, account, units, acquisition_date, market_value, basis), (market_value_base, basis_base) in zip(
+            zip(col('sortkey'), col('account'), col('units'), col('acquisition_date'), col('market_value'),
+                col('basis')), converted):
+        if not market_value.get_only_position():
+            continue
+        units, ticker = split_currency(units)
+        market_value, currency = split_currency(market_value)
+        basis, cost_currency = split_currency(basis)
+        currency_base = None
+        if base_currency:
+            market_value_base, currency_base = split_currency(market_value_base)
+            basis_base = val(basis_base)
+        table.append(sortkey, account, ticker, units, acquisition_date, market_value, currency,
+                     basis, cost_currency, market_value_base, currency_base, basis_base)
+    return table
+
+
+def ledger_fingerprints(entries):
+    """Hash the transactions and the prices mentioning each currency, so we can tell which currencies
+    changed between two loads of a ledger. Returns (transaction hashes, price hashes, quote currencies)."""
+    txns = collections.defaultdict(int)
+    prices = collections.defaultdict(int)
+    quote_currencies = set()
+    for entry in entries:
+        if isinstance(entry, Transaction):
+            for p in entry.postings:
+                c = p.units.currency
+                txns[c] = hash((txns[c], entry.date, p.account, p.units.number, p.cost))
+        elif isinstance(entry, Price):
+            c = entry.currency
+            prices[c] = hash((prices[c], entry.date, entry.amount))
+            quote_currencies.add(entry.amount.currency)
+    return txns, prices, quote_currencies
+
+
+def changed_currencies(old, new):
+    return {c for c in old.keys() | new.keys() if old.get(c) != new.get(c)}
+
+
+def merge_lot_tables(old, fresh, tickers):
+    """Replace the lots of tickers in old with the ones in fresh, keeping the query's sort order."""
+    rows = [(k, lot) for k, lot in zip(old.sortkeys, old) if lot.ticker not in tickers]
+    rows += zip(fresh.sortkeys, fresh)
+    rows.sort(key=lambda r: (r[0], r[1].ticker, r[1].acquisition_date or datetime.date.min))
+
+    table = LotTable(old.base_currency)
+    for sortkey, lot in rows:
+        table.append(sortkey, *lot)
+    return table
+
+
+def build_lot_table_incremental(accapi, account_field, accounts_pattern):
+    """Build the lot table by updating the one from the previous load of this ledger (see lot_history).
+
+    Lots of a ticker only change when a transaction or price mentioning it changes. However, a change in
+    the price of a quote currency (eg: an exchange rate) affects the converted value of every lot priced in
+    it, and so causes a full rebuild."""
+    operating_currencies = accapi.get_operating_currencies()
+    base_currency = operating_currencies[0] if operating_currencies else None
+    key = (accapi.source_key(), account_field, accounts_pattern, base_currency)
+
+    fingerprints = ledger_fingerprints(accapi.get_entries())
+    previous = lot_history.get(key)
+    if previous is None:
+        table = build_lot_table(accapi, account_field, accounts_pattern)
+    else:
+        (old_txns, old_prices, old_quotes), old_table = previous
+        txns, prices, quotes = fingerprints
+        changed_prices = changed_currencies(old_prices, prices)
+        tickers = changed_currencies(old_txns, txns) | changed_prices
+        if changed_prices & (quotes | old_quotes):
+            table = build_lot_table(accapi, account_field, accounts_pattern)
+        elif tickers:
+            fresh = build_lot_table(accapi, account_field, accounts_pattern, tickers)
+            table = merge_lot_tables(old_table, fresh, tickers)
+        else:
+            table = old_table
+
+    lot_history.put(key, (fingerprints, table))
+    return table
+
+
+def get_lots(accapi, options):
+    """Return the LotTable for the accounts selected by options ('accounts_pattern', 'account_field'). The
+    table is built at most once per accapi (and in Fava, per ledger load and filter selection). If
+    options['incremental'] is set, it is updated from the previous load's table instead of being rebuilt."""
+    account_field = get_account_field(options)
+    accounts_pattern = options.get('accounts_pattern', '')
+    incremental = options.get('incremental', False)
+    build = build_lot_table_incremental if incremental else build_lot_table
+    return accapi.memoize(('lots', account_field, accounts_pattern, incremental),
+                          lambda: build(accapi, account_field, accounts_pattern))
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Per-call timing of the accapi methods that do the heavy lifting (queries, realization, price maps), to
+tell where the time goes when a module is slow. Off unless enabled, so costs nothing in normal use."""
+
+import collections
+import contextlib
+import functools
+import time
+from beancount.core.number import Decimal, D
+
+
+class Profiler:
+    """Accumulates the number of calls and the wall time spent, by name. Times are inclusive: a profiled
+    method that calls another one is charged for the time spent in both."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.clear()
+
+    def clear(self):
+        self.calls = collections.Counter()
+        self.seconds = collections.defaultdict(float)
+        self.started = time.perf_counter()
+
+    def record(self, name, seconds):
+        self.calls[name] += 1
+        self.seconds[name] += seconds
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def table(self):
+        """Calls and times (in milliseconds) by name, slowest first, as a (rtypes, rrows, None, footer) table.
+        The footer holds the time elapsed since the profiler was cleared."""
+        rtypes = [('name', str), ('calls', int), ('total_ms', Decimal), ('avg_ms', Decimal)]
+        RetRow = collections.namedtuple('RetRow', [i[0] for i in rtypes])
+
+        def ms(seconds):
+            return D(seconds * 1000).quantize(D('0.1'))
+
+        rrows = [RetRow(name, self.calls[name], ms(seconds), ms(seconds / self.calls[name]))
+                 for name, seconds in sorted(self.seconds.items(), key=lambda x: x[1], reverse=True)]
+        footer = [(str, 'elapsed'), (str, ''), (Decimal, ms(time.perf_counter() - self.started)), (str, '')]
+        return rtypes, rrows, None, footer
+
+
+def profiled(method):
+    """Decorator for accapi methods: records the time of each call in self.profiler, if it is enabled."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.profiler.enabled:
+            return method(self, *args, **kwargs)
+        with self.profiler.timer(method.__name__):
+            return method(self, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""Parse BQL queries once. Parsing dominates the time beanquery spends on most of our queries (which then run
+in a fraction of it), so parsed queries are cached by their text. Values that vary between calls (patterns,
+currencies, tickers) are passed as parameters (eg: "WHERE account ~ %(pattern)s"), so that the query text,
+and thus its parse, is reused. Parameters are bound as values, and are never parsed as BQL."""
+
+from beanquery import parser
+from fava_investor.common.resultcache import ResultCache
+
+# Shared by all accapis: the parse depends only on the text of the query
+parsed_queries = ResultCache(maxsize=128)
+
+
+def parse(sql):
+    return parsed_queries.lookup(sql, lambda: parser.parse(sql), 'parse')
+
+
+def format_params(sql, params):
+    """Substitute params into sql as string literals, for query engines that don't support parameters"""
+    if not params:
+        return sql
+    return sql % {k: '"{}"'.format(str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in params.items()}
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Small LRU cache for memoizing module results across page renders and CLI calls."""
+
+import collections
+
+
+class ResultCache:
+    """LRU cache mapping hashable keys to computed results. Tracks hits and misses so callers can report
+    how effective the cache is. hit_counts breaks hits down by the optional name given to lookup(), which
+    is the number of recomputations of that result avoided."""
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.data = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.hit_counts = collections.Counter()
+
+    def lookup(self, key, compute, name=None):
+        """Return the cached result for key, calling compute() to build (and cache) it if absent."""
+        if key in self.data:
+            self.hits += 1
+            self.hit_counts[name] += 1
+            self.data.move_to_end(key)
+            return self.data[key]
+
+        self.misses += 1
+        result = compute()
+        self.put(key, result)
+        return result
+
+    def get(self, key, default=None):
+        """Return the cached result for key without counting a hit or miss."""
+        return self.data.get(key, default)
+
+    def put(self, key, result):
+        self.data[key] = result
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def clear(self):
+        self.data.clear()
+
+    def __len__(self):
+        return len(self.data)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Columnar table for module output.
+
+Modules return their tables as (rtypes, rows, None, footer) tuples, which Fava's querytable macro and
+pretty_print_table() consume. Table holds the same data as one list per column instead, so that footers,
+sorting, and csv export work on whole columns rather than row by row. It unpacks (and indexes) like the
+tuple, so it can be returned anywhere the tuple is expected.
+"""
+
+import csv
+from fava_investor.common.libinvestor import row_type, build_columns_footer
+
+
+class Table:
+    def __init__(self, rtypes, columns=None, footer=None):
+        """rtypes is a list of (name, type). columns, if given, is a list of sequences of values, one for
+        each entry in rtypes."""
+        self.rtypes = list(rtypes)
+        self.columns = [list(c) for c in columns] if columns else [[] for _ in self.rtypes]
+        self.index = {name: i for i, (name, _) in enumerate(self.rtypes)}
+        self.footer = footer
+        self._rows = None
+
+    @classmethod
+    def from_rows(cls, rtypes, rows, footer=None):
+        return cls(rtypes, zip(*rows) if rows else None, footer)
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def column(self, name):
+        return self.columns[self.index[name]]
+
+    def add_column(self, name, type_, values):
+        self.rtypes.append((name, type_))
+        self.index[name] = len(self.columns)
+        self.columns.append(list(values))
+        self._rows = None
+
+    def rows(self):
+        """Rows as namedtuples, for consumers that work row by row (eg: Fava's querytable macro). Built once,
+        and rebuilt only after sort() or add_column(), so callers must not modify the returned list."""
+        if self._rows is None:
+            Row = row_type(tuple(self.index))
+            self._rows = [Row._make(r) for r in zip(*self.columns)]
+        return self._rows
+
+    def as_tuple(self):
+        return self.rtypes, self.rows(), None, self.footer
+
+    def __iter__(self):
+        return iter(self.as_tuple())
+
+    def __getitem__(self, i):
+        if i in (1, -3):
+            return self.rows()
+        return (self.rtypes, None, None, self.footer)[i]
+
+    def sort(self, name, key=None, reverse=False):
+        """Sort all columns by the values in column `name` (stable, like list.sort())"""
+        column = self.column(name)
+        order = sorted(range(len(column)), key=(lambda i: key(column[i])) if key else column.__getitem__,
+                       reverse=reverse)
+        self.columns = [[c[i] for i in order] for c in self.columns]
+        self._rows = None
+
+    def build_footer(self, accapi, price_map=None):
+        """Sum each Decimal and Inventory column into the footer. See libinvestor.build_table_footer()."""
+        self.footer = build_columns_footer(self.rtypes, self.columns, accapi, price_map)
+        return self.footer
+
+    def write_csv(self, f):
+        writer = csv.writer(f)
+        writer.writerow(self.index)
+        writer.writerows(zip(*self.columns))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import os
+import sys
+import tempfile
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), '.'))
+import beancountinvestorapi as api
+
+
+class TestPriceMapMemo(unittest.TestCase):
+    def test_price_map_built_once(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.beancount') as f:
+            f.write('2020-01-01 price VTI 100 USD\n')
+            f.flush()
+            accapi = api.AccAPI(f.name, {})
+
+            price_map = accapi.build_price_map()
+            self.assertIs(price_map, accapi.build_beancount_price_map())
+            self.assertIs(price_map, accapi.build_filtered_price_map('VTI', 'USD'))
+            self.assertEqual(2, accapi.results.hit_counts['price_map'])
+
+
+class TestProfiler(unittest.TestCase):
+    def test_calls_recorded_when_enabled(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.beancount') as f:
+            f.write('2020-01-01 price VTI 100 USD\n')
+            f.flush()
+            accapi = api.AccAPI(f.name, {})
+            accapi.query_func('SELECT date')
+            self.assertEqual(0, accapi.profiler.calls['query_func'])
+
+            accapi.profiler.enabled = True
+            try:
+                accapi.query_func('SELECT date')
+                accapi.query_func('SELECT date')
+                rtypes, rrows, _, footer = accapi.profiler.table()
+            finally:
+                accapi.profiler.enabled = False
+                accapi.profiler.clear()
+            self.assertEqual({'query_func': 2, 'query_table': 2}, {r.name: r.calls for r in rrows})
+
+
+class TestQueryParams(unittest.TestCase):
+    def test_params_bound_and_parse_reused(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.beancount') as f:
+            f.write('2010-01-01 open Assets:Bank\n2010-01-01 open Income:Job\n'
+                    '2020-01-01 * "Pay"\n Assets:Bank 10 USD\n Income:Job\n')
+            f.flush()
+            accapi = api.AccAPI(f.name, {})
+            sql = 'SELECT account WHERE account ~ %(pattern)s'
+            hits = api.querycache.parsed_queries.hit_counts['parse']
+
+            rtypes, rrows = accapi.query_func(sql, {'pattern': 'Bank'})
+            self.assertEqual(['Assets:Bank'], [r.account for r in rrows])
+
+            # quotes in a parameter are part of the value, not of the query
+            rtypes, rrows = accapi.query_func(sql, {'pattern': "Bank' OR account ~ 'Income"})
+            self.assertEqual([], rrows)
+            self.assertEqual(hits + 1, api.querycache.parsed_queries.hit_counts['parse'])
+
+    def test_query_table(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.beancount') as f:
+            f.write('2010-01-01 open Assets:Bank\n2010-01-01 open Income:Job\n'
+                    '2020-01-01 * "Pay"\n Assets:Bank 10 USD\n Income:Job\n')
+            f.flush()
+            accapi = api.AccAPI(f.name, {})
+            result = accapi.query_table('SELECT account, number ORDER BY account')
+            self.assertEqual(['Assets:Bank', 'Income:Job'], list(result.column('account')))
+            self.assertEqual(-10, result.column('number')[1])
+
+            # rows share one namedtuple class across queries with the same columns
+            _, rrows = accapi.query_func('SELECT account, number ORDER BY account')
+            self.assertIs(type(rrows[0]), type(next(iter(result))))
+            self.assertEqual(list(result), rrows)
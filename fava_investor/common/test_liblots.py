@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import tempfile
+import unittest
+from beancount.utils import test_utils
+sys.path.append(os.path.join(os.path.dirname(__file__), '.'))
+import beancountinvestorapi as api
+import liblots
+# To run: pytest
+
+
+class TestLotTable(test_utils.TestCase):
+    def setUp(self):
+        self.options = {'accounts_pattern': "Assets:Investments:Taxable"}
+
+    @test_utils.docfile
+    def test_lots(self, f):
+        """
+        option "operating_currency" "USD"
+        2010-01-01 open Assets:Investments:Taxable:Brokerage
+        2010-01-01 open Assets:Bank
+
+        2015-01-01 * "Buy stock"
+         Assets:Investments:Taxable:Brokerage 10 BNCT {100 USD}
+         Assets:Bank
+
+        2016-01-01 * "Buy stock"
+         Assets:Investments:Taxable:Brokerage 5 BNCT {120 USD}
+         Assets:Bank
+
+        2018-01-01 price BNCT 110 USD
+        """
+        accapi = api.AccAPI(f, {})
+        lots = liblots.get_lots(accapi, self.options)
+
+        self.assertEqual(2, len(lots))
+        self.assertEqual(['BNCT', 'BNCT'], lots.column('ticker'))
+        self.assertEqual([1100, 550], lots.column('market_value'))
+        self.assertEqual([1000, 600], lots.column('basis'))
+        self.assertEqual([1100, 550], lots.column('market_value_base'))
+        self.assertEqual('Brokerage', next(iter(lots)).account)
+
+        # Second request for the same accounts is served from the memo
+        self.assertIs(lots, liblots.get_lots(accapi, dict(self.options)))
+        # but not for a module that asked for an incremental table
+        self.assertIsNot(lots, liblots.get_lots(accapi, dict(self.options, incremental=True)))
+
+
+class TestIncrementalLots(unittest.TestCase):
+    ledger = """
+option "operating_currency" "USD"
+2010-01-01 open Assets:Investments:Taxable:Brokerage
+2010-01-01 open Assets:Bank
+2015-01-01 * "Buy"
+ Assets:Investments:Taxable:Brokerage 10 BNCT {100 USD}
+ Assets:Bank
+2015-01-01 * "Buy"
+ Assets:Investments:Taxable:Brokerage 10 COFE {100 USD}
+ Assets:Bank
+2018-01-01 price BNCT 110 USD
+2018-01-01 price COFE 90 USD
+"""
+
+    def load(self, filename):
+        """Load filename, recording the queries run against it"""
+        accapi = api.AccAPI(filename, {})
+        accapi.sqls = []
+        query_table = accapi.query_table
+
+        def recording_query_table(sql, params=None):
+            accapi.sqls.append((sql, params))
+            return query_table(sql, params)
+        accapi.query_table = recording_query_table
+        return accapi
+
+    def test_only_changed_tickers_requeried(self):
+        options = {'accounts_pattern': 'Taxable', 'account_field': 'account', 'incremental': True}
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'main.beancount')
+            with open(filename, 'w') as f:
+                f.write(self.ledger)
+            self.assertEqual(2, len(liblots.get_lots(self.load(filename), options)))
+
+            with open(filename, 'a') as f:
+                f.write('2018-01-02 price COFE 80 USD\n')
+                f.write('2018-01-02 * "Buy"\n Assets:Investments:Taxable:Brokerage 5 COFE {80 USD}\n'
+                        ' Assets:Bank\n')
+            accapi = self.load(filename)
+            lots = liblots.get_lots(accapi, options)
+            sql, params = accapi.sqls[0]
+            self.assertIn("currency ~ %(tickers)s AND", sql)
+            self.assertEqual('^(COFE|USD)$', params['tickers'])
+
+            full = liblots.build_lot_table(self.load(filename), 'account', 'Taxable')
+            self.assertEqual(list(full), list(lots))
+            self.assertEqual([1100, 800, 400], lots.column('market_value'))
+
+            # unchanged ledger: nothing is queried
+            accapi = self.load(filename)
+            self.assertIs(lots, liblots.get_lots(accapi, options))
+            self.assertEqual([], accapi.sqls)
@@ -0,0 +1,28 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), '.'))
+from resultcache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+    def test_lookup_computes_once(self):
+        cache = ResultCache()
+        calls = []
+        for _ in range(3):
+            self.assertEqual(42, cache.lookup('k', lambda: calls.append(1) or 42))
+        self.assertEqual(1, len(calls))
+        self.assertEqual((2, 1), (cache.hits, cache.misses))
+
+    def test_lru_eviction(self):
+        cache = ResultCache(maxsize=2)
+        cache.lookup('a', lambda: 1)
+        cache.lookup('b', lambda: 2)
+        cache.lookup('a', lambda: 1)  # 'a' is now most recently used
+        cache.lookup('c', lambda: 3)
+        self.assertEqual(['a', 'c'], list(cache.data))
+
+        cache.clear()
+        self.assertEqual(0, len(cache))
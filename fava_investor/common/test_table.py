@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+
+import io
+import sys
+import os
+import unittest
+from beancount.core.number import Decimal, D
+sys.path.append(os.path.join(os.path.dirname(__file__), '.'))
+from table import Table
+
+
+class TestTable(unittest.TestCase):
+    def setUp(self):
+        self.table = Table.from_rows([('ticker', str), ('value', Decimal)],
+                                     [('B', D('2')), ('A', D('1')), ('C', D('2'))])
+
+    def test_unpacks_like_tuple(self):
+        rtypes, rows, _, footer = self.table
+        self.assertEqual(['ticker', 'value'], [r[0] for r in rtypes])
+        self.assertEqual('B', rows[0].ticker)
+        self.assertEqual(3, len(self.table[1]))
+        self.assertIsNone(footer)
+
+    def test_sort_is_stable(self):
+        self.table.sort('value', reverse=True)
+        self.assertEqual(['B', 'C', 'A'], self.table.column('ticker'))
+
+    def test_add_column_and_csv(self):
+        self.table.add_column('double', Decimal, (v * 2 for v in self.table.column('value')))
+        self.assertEqual(D('4'), self.table.rows()[0].double)
+
+        f = io.StringIO()
+        self.table.write_csv(f)
+        self.assertEqual('ticker,value,double\r\nB,2,4\r\n', f.getvalue().split('A')[0])
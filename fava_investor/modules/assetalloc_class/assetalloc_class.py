@@ -6,6 +6,7 @@ import beancountinvestorapi as api
 from beancount.core import realization
 from beancount.core import display_context
 import click
+import concurrent.futures
 import os
 import sys
 import tabulate
@@ -36,15 +37,54 @@ def formatted_tree(root):
                              tablefmt='simple')
 
 
+def gen_output(accapi):
+    config = accapi.get_custom_config('asset_alloc_by_class')
+    asset_buckets_tree, realacc = libassetalloc.assetalloc(accapi, config)
+    yield click.style('Asset Allocation\n', bg='green', fg='white')
+    yield formatted_tree(asset_buckets_tree) + '\n\n'
+
+
+def ledger_buckets(beancount_file):
+    """Load a ledger, and return its asset buckets and base currency. Runs in a worker process when several
+    ledgers are given."""
+    accapi = api.AccAPI(beancount_file, {})
+    config = accapi.get_custom_config('asset_alloc_by_class')
+    asset_buckets, _ = libassetalloc.assetalloc_buckets(accapi, config)
+    return dict(asset_buckets), accapi.get_operating_currencies()[0]
+
+
+def multi_ledger_tree(beancount_files, jobs):
+    """Asset allocation tree of several ledgers combined. Ledgers are loaded and bucketized in up to `jobs`
+    processes, and only their (small) asset buckets are sent back to be merged."""
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(ledger_buckets, beancount_files))
+    else:
+        results = [ledger_buckets(f) for f in beancount_files]
+
+    currencies = {currency for _, currency in results}
+    if len(currencies) > 1:
+        raise click.ClickException("Ledgers must share the same first operating currency to be combined. "
+                                   f"Found: {', '.join(sorted(currencies))}")
+    return libassetalloc.treeify(libassetalloc.merge_buckets(b for b, _ in results), currencies.pop())
+
+
 @click.command()
-@click.argument('beancount-file', type=click.Path(exists=True), envvar='BEANCOUNT_FILE')
-@click.option('-d', '--dump-balances-tree', help='Show tree', is_flag=True)
-def assetalloc_class(beancount_file, dump_balances_tree):
+@click.argument('beancount-files', nargs=-1, required=True, type=click.Path(exists=True),
+                envvar='BEANCOUNT_FILE')
+@click.option('-d', '--dump-balances-tree', help='Show tree (single ledger only)', is_flag=True)
+@click.option('-j', '--jobs', type=int, help='With several ledgers, load up to this many in parallel. Defaults '
+              'to the number of ledgers, up to the number of CPUs')
+def assetalloc_class(beancount_files, dump_balances_tree, jobs):
     """Beancount Asset Allocation Analyzer.
 
        The BEANCOUNT_FILE environment variable can optionally be set instead of specifying the file on the
        command line.
 
+       Several ledgers (eg: one per family member) can be given, to report their combined asset allocation.
+       Each ledger is read with its own configuration. In BEANCOUNT_FILE, separate them with the path
+       separator (':' on Unix).
+
        The configuration for this module is expected to be supplied as a custom directive like so in your
        beancount file:
 
@@ -55,7 +95,14 @@ def assetalloc_class(beancount_file, dump_balances_tree):
               'skip-tax-adjustment': True,
           }}"
     """
-    accapi = api.AccAPI(beancount_file, {})
+    if len(beancount_files) > 1:
+        if dump_balances_tree:
+            raise click.UsageError('--dump-balances-tree only works with a single ledger')
+        jobs = jobs or min(len(beancount_files), os.cpu_count() or 1)
+        click.echo_via_pager(formatted_tree(multi_ledger_tree(beancount_files, jobs)))
+        return
+
+    accapi = api.AccAPI(beancount_files[0], {})
     config = accapi.get_custom_config('asset_alloc_by_class')
     asset_buckets_tree, realacc = libassetalloc.assetalloc(accapi, config)
 
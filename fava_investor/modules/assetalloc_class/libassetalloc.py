@@ -56,7 +56,7 @@ def compute_parent_balances(node):
         compute_parent_balances(c)
 
 
-def treeify(asset_buckets, accapi):
+def treeify(asset_buckets, currency):
     def ancestors(s):
         c = s.count('_')
         for i in range(c, -1, -1):
@@ -66,7 +66,7 @@ def treeify(asset_buckets, accapi):
     root.balance = 0
     # The entire asset class tree has to be in a single currency (so they're all comparable). We store this
     # one currency in the root node.
-    root.currency = accapi.get_operating_currencies()[0]
+    root.currency = currency
     for bucket, balance in asset_buckets.items():
         node = root
         for p in ancestors(bucket):
@@ -195,7 +195,19 @@ def tax_adjust(realacc, accapi):
     return realacc
 
 
-def assetalloc(accapi, config={}):
+def merge_buckets(asset_buckets_list):
+    """Sum asset buckets from several ledgers (eg: one per family member) into one"""
+    merged = collections.defaultdict(int)
+    for asset_buckets in asset_buckets_list:
+        for bucket, balance in asset_buckets.items():
+            merged[bucket] += balance
+    return merged
+
+
+def assetalloc_buckets(accapi, config={}):
+    """Asset buckets (see bucketize()) of the accounts selected by config, and the realization they were built
+    from. assetalloc() turns these into a tree. Exposed separately so that buckets from several ledgers can
+    be merged (see merge_buckets()) before building the tree."""
     realacc = build_interesting_realacc(accapi, config.get('accounts_patterns', ['.*']))
     # print(realization.compute_balance(realacc).reduce(convert.get_units))
 
@@ -204,6 +216,9 @@ def assetalloc(accapi, config={}):
     # print(realization.compute_balance(realacc).reduce(convert.get_units))
 
     balance = realization.compute_balance(realacc)
-    asset_buckets = bucketize(balance, accapi)
+    return bucketize(balance, accapi), realacc
 
-    return treeify(asset_buckets, accapi), realacc
+
+def assetalloc(accapi, config={}):
+    asset_buckets, realacc = assetalloc_buckets(accapi, config)
+    return treeify(asset_buckets, accapi.get_operating_currencies()[0]), realacc
@@ -2,6 +2,7 @@
 
 import sys
 import os
+import textwrap
 from beancount.utils import test_utils
 import click.testing
 sys.path.append(os.path.join(os.path.dirname(__file__), '.'))
@@ -261,3 +262,53 @@ class TestScriptCheck(ClickTestCase):
             international       750         60.0%
         """
         self.assertLines(expected_output, result.stdout)
+
+    @test_utils.docfile
+    def test_multiple_ledgers(self, filename):
+        """
+        option "operating_currency" "USD"
+        2010-01-01 open Assets:Investments:Brokerage
+        2010-01-01 open Assets:Bank
+        2010-01-01 commodity BNCT
+         asset_allocation_equity: 100
+
+        2011-03-02 * "Buy stock"
+         Assets:Investments:Brokerage 3 BNCT {100 USD}
+         Assets:Bank
+
+        2011-03-02 price BNCT 100 USD
+        2010-01-01 custom "fava-extension" "fava_investor" "{
+          'asset_alloc_by_class' : {
+              'accounts_patterns': ['Assets:Investments'],
+          }
+        }"
+        """
+        other = os.path.join(os.path.dirname(filename), 'other.beancount')
+        with open(other, 'w') as f:
+            f.write(textwrap.dedent("""
+            option "operating_currency" "USD"
+            2010-01-01 open Assets:Investments:Brokerage
+            2010-01-01 open Assets:Bank
+            2010-01-01 commodity BOND
+             asset_allocation_bond: 100
+
+            2011-03-02 * "Buy bond"
+             Assets:Investments:Brokerage 1 BOND {100 USD}
+             Assets:Bank
+
+            2011-03-02 price BOND 100 USD
+            2010-01-01 custom "fava-extension" "fava_investor" "{
+              'asset_alloc_by_class' : {
+                  'accounts_patterns': ['Assets:Investments'],
+              }
+            }"
+            """))
+        result = self.run_with_args(assetalloc_class.assetalloc_class, filename, other, '--jobs', '1')
+        expected_output = """
+        asset_type      amount    percentage
+        ------------  --------  ------------
+        Total              400        100.0%
+         bond              100         25.0%
+         equity            300         75.0%
+        """
+        self.assertLines(expected_output, result.stdout)
@@ -7,6 +7,13 @@ from fava_investor.common.clicommon import pretty_print_table
 import fava_investor.common.beancountinvestorapi as api
 
 
+def gen_output(accapi):
+    config = accapi.get_custom_config('cashdrag')
+    tables = libcashdrag.find_loose_cash(accapi, config)
+    for title, (rtypes, rrows, _, _) in tables:
+        yield pretty_print_table(title, rtypes, rrows, floatfmt=",.0f")
+
+
 @click.command()
 @click.argument('beancount-file', type=click.Path(exists=True), envvar='BEANCOUNT_FILE')
 def cashdrag(beancount_file):
@@ -27,14 +34,7 @@ def cashdrag(beancount_file):
         }}"
     """
     accapi = api.AccAPI(beancount_file, {})
-    config = accapi.get_custom_config('cashdrag')
-    tables = libcashdrag.find_loose_cash(accapi, config)
-
-    def _gen_output():
-        for title, (rtypes, rrows, _, _) in tables:
-            yield pretty_print_table(title, rtypes, rrows, floatfmt=",.0f")
-
-    click.echo_via_pager(_gen_output())
+    click.echo_via_pager(gen_output(accapi))
 
 
 if __name__ == '__main__':
@@ -1,6 +1,6 @@
 #!/bin/env python3
 
-import fava_investor.common.libinvestor as libinvestor
+from fava_investor.common.table import Table
 from beancount.core.inventory import Inventory
 
 
@@ -26,25 +26,28 @@ def find_loose_cash(accapi, options):
     currencies_pattern, main_currency = find_cash_commodities(accapi, options)
     sql = """
     SELECT account AS account,
-           CONVERT(sum(position), '{main_currency}') AS position
-      WHERE account ~ '{accounts_pattern}'
-      AND not account ~ '{accounts_exclude_pattern}'
-      AND currency ~ '{currencies_pattern}'
+           CONVERT(sum(position), %(main_currency)s) AS position
+      WHERE account ~ %(accounts_pattern)s
+      AND not account ~ %(accounts_exclude_pattern)s
+      AND currency ~ %(currencies_pattern)s
     GROUP BY account
     ORDER BY position DESC
-    """.format(main_currency=main_currency,
-               accounts_pattern=options.get('accounts_pattern', '^Assets'),
-               accounts_exclude_pattern=options.get('accounts_exclude_pattern', '^   $'),  # TODO
-               currencies_pattern=currencies_pattern,
-               )
-    rtypes, rrows = accapi.query_func(sql)
-    if not rtypes:
+    """
+    params = dict(main_currency=main_currency,
+                  accounts_pattern=options.get('accounts_pattern', '^Assets'),
+                  accounts_exclude_pattern=options.get('accounts_exclude_pattern', '^   $'),  # TODO
+                  currencies_pattern=currencies_pattern,
+                  )
+    result = accapi.query_table(sql, params)
+    if not result.rtypes:
         return [], {}, [[]]
 
-    rrows = [r for r in rrows if r.position != Inventory()]
+    positions = result.column('position')
+    keep = [i for i, p in enumerate(positions) if p != Inventory()]
     threshold = options.get('min_threshold', 0)
     if threshold:
-        rrows = [r for r in rrows if r.position.get_only_position().units.number >= threshold]
+        keep = [i for i in keep if positions[i].get_only_position().units.number >= threshold]
 
-    footer = libinvestor.build_table_footer(rtypes, rrows, accapi)
-    return [('Cash Drag Analysis', (rtypes, rrows, None, footer))]
+    table = Table(result.rtypes, [[c[i] for i in keep] for c in map(result.column, result.index)])
+    table.build_footer(accapi)
+    return [('Cash Drag Analysis', table)]
@@ -6,124 +6,122 @@ _Determine lots to sell to minimize capital gains taxes._
 See accompanying README.txt
 """
 
+import bisect
 import collections
-from datetime import datetime
-from fava_investor.common.libinvestor import val, build_config_table, insert_column, split_currency
+import itertools
+from datetime import date, datetime
+from fava_investor.common.libinvestor import build_config_table
+from fava_investor.common.liblots import get_lots
+from fava_investor.common.table import Table
 from beancount.core.number import Decimal, D
 from fava_investor.modules.tlh import libtlh
 
 
+class TaxCurve:
+    """The cumulative proceeds vs. taxes curve from the main table output by find_minimized_gains(), held as
+    sorted columns. Built once, it answers tax_burden() for any number of amounts with a binary search.
+
+    cu_proceeds only decreases at lots with negative market value (eg: short positions), so it is not always
+    sorted. The search is done on its running maximum instead, which finds the same row as scanning the table
+    for the first cu_proceeds above the amount."""
+
+    def __init__(self, table):
+        table = table[1]
+        self.cu_proceeds = table.column('cu_proceeds')
+        self.max_proceeds = list(itertools.accumulate(self.cu_proceeds, max))
+        self.cu_taxes = table.column('cu_taxes')
+        self.tax_marg = table.column('tax_marg')
+
+    def tax_burden(self, amount):
+        """
+        Interpolate tax burden for `amount`. Returns (amount, cu_taxes, tax_avg, tax_marg), or None if
+        amount is not less than the total proceeds of selling everything.
+
+        Eg table:
+        cu_proceeds cu_taxes
+             15       1
+             25     100
+
+        amount = 22. We interpoloate between 15 and 25:
+        25-15 = 10
+        22-15 = 7
+        Interpolated tax burden: 1 +  (  7/10 * (100-1) )
+
+        Amounts below the first row are interpolated from (0, 0). The average rate for an amount of 0 is 0.
+        """
+        i = bisect.bisect_right(self.max_proceeds, amount)  # first row with cu_proceeds > amount
+        if i == len(self.cu_proceeds):
+            return None
+        prev_proceeds, prev_taxes = (self.cu_proceeds[i-1], self.cu_taxes[i-1]) if i else (0, 0)
+        ratio = (amount - prev_proceeds) / (self.cu_proceeds[i] - prev_proceeds)
+        cu_taxes = prev_taxes + ((self.cu_taxes[i] - prev_taxes) * ratio)
+        tax_avg = (cu_taxes / amount) * 100 if amount else 0
+        return amount, cu_taxes, tax_avg, self.tax_marg[i]
+
+
 def find_tax_burden(table, amount):
     """
     Interpolate tax burden from table for `amount`
 
-    'table' is the main table output by find_minimized_gains() below.
-
-    Eg table:
-    cu_proceeds cu_taxes
-         15       1
-         25     100
-
-    amount = 22. We interpoloate between 15 and 25:
-    25-15 = 10
-    22-15 = 7
-    Interpolated tax burden: 1 +  (  7/10 * (100-1) )
+    'table' is the main table output by find_minimized_gains() below. To look up many amounts, build a
+    TaxCurve once instead.
     """
-    prev = None
-    for row in table[1][1]:
-        if row.cu_proceeds > amount:
-            ratio = (amount - prev.cu_proceeds) / (row.cu_proceeds - prev.cu_proceeds)
-            cu_taxes = prev.cu_taxes + ((row.cu_taxes - prev.cu_taxes) * ratio)
-            tax_avg = (cu_taxes / amount) * 100
-            return amount, cu_taxes, tax_avg, row.tax_marg
-        prev = row
-    return None
+    return TaxCurve(table).tax_burden(amount)
 
 
-def find_minimized_gains(accapi, options):
-    account_field = libtlh.get_account_field(options)
-    accounts_pattern = options.get('accounts_pattern', '')
-    tax_rate = {'Short': Decimal(options.get('st_tax_rate', 1)),
-                'Long':  Decimal(options.get('lt_tax_rate', 1))}
-
-    currency = accapi.get_operating_currencies()[0]
-
-    sql = f"""
-    SELECT
-        {account_field} as account,
-        units(sum(position)) as units,
-        CONVERT(value(sum(position)), '{currency}') as market_value,
-        cost_date as acq_date,
-        CONVERT(cost(sum(position)), '{currency}') as basis
-      WHERE account_sortkey(account) ~ "^[01]" AND
-        account ~ '{accounts_pattern}'
-      GROUP BY {account_field}, cost_date, currency, cost_currency, cost_number, account_sortkey(account)
-      ORDER BY account_sortkey(account), currency, cost_date
-    """
-    rtypes, rrows = accapi.query_func(sql)
-    if not rtypes:
-        return [], {}, [[]]
-
-    # Since we GROUP BY cost_date, currency, cost_currency, cost_number, we never expect any of the
-    # inventories we get to have more than a single position. Thus, we can and should use
-    # get_only_position() below. We do this grouping because we are interested in seeing every lot (price,
-    # date) seperately, that can be sold to generate a TLH
-
-    # our output table is slightly different from our query table:
-    retrow_types = rtypes[:-1] + [('term', str), ('gain', Decimal),
-                                  ('est_tax', Decimal), ('est_tax_percent', Decimal)]
-    retrow_types = insert_column(retrow_types, 'units', Decimal, 'ticker', str)
-    retrow_types = insert_column(retrow_types, 'market_value', Decimal, 'currency', str)
-
-    # rtypes:
-    # [('account', <class 'str'>),
-    #  ('units', <class 'beancount.core.inventory.Inventory'>),
-    #  ('acq_date', <class 'datetime.date'>),
-    #  ('market_value', <class 'beancount.core.inventory.Inventory'>),
-    #  ('basis', <class 'beancount.core.inventory.Inventory'>)]
+def sweep_tax_burden(table, amounts):
+    """Tax burden for each of `amounts`, all answered from a single TaxCurve built from `table` (the main
+    table output by find_minimized_gains()). Amounts beyond the total proceeds are left out."""
 
+    curve = TaxCurve(table)
+    retrow_types = [('amount', Decimal), ('cu_taxes', Decimal), ('tax_avg', Decimal), ('tax_marg', Decimal)]
     RetRow = collections.namedtuple('RetRow', [i[0] for i in retrow_types])
+    rrows = [RetRow(*burden) for burden in map(curve.tax_burden, amounts) if burden is not None]
+    return 'Tax burden by amount', (retrow_types, rrows, None, None)
 
-    to_sell = []
-    for row in rrows:
-        if row.market_value.get_only_position():
-            gain = D(val(row.market_value) - val(row.basis))
-            term = libtlh.gain_term(row.acq_date, datetime.today().date())
-            est_tax = gain * tax_rate[term]
 
-            to_sell.append(RetRow(row.account, *split_currency(row.units),
-                           *split_currency(row.market_value), row.acq_date, term, gain, est_tax,
-                           (est_tax / val(row.market_value)) * 100))
-
-    to_sell.sort(key=lambda x: x.est_tax_percent)
+def find_minimized_gains(accapi, options):
+    tax_rate = {'Short': Decimal(options.get('st_tax_rate', 1)),
+                'Long':  Decimal(options.get('lt_tax_rate', 1))}
 
-    # add cumulative column ([:-2] to remove est_tax and est_tax_percent)
-    retrow_types = [('cu_proceeds', Decimal), ('cu_taxes', Decimal),
-                    ('tax_avg', Decimal), ('tax_marg', Decimal)] + \
-                    retrow_types[:-2] + [('cu_gains', Decimal)]  # noqa: E127
+    # Market value and basis are converted to the operating currency, so lots held in different currencies
+    # can be compared and accumulated
+    lots = get_lots(accapi, options)
+
+    # computed a column at a time. Lots are then ordered by est_tax_percent
+    today = datetime.today().date()
+    market_value = lots.column('market_value_base')
+    gain = [D(mv - basis) for mv, basis in zip(market_value, lots.column('basis_base'))]
+    term = [libtlh.gain_term(acq_date, today) for acq_date in lots.column('acquisition_date')]
+    est_tax = [g * tax_rate[t] for g, t in zip(gain, term)]
+    est_tax_percent = [(tax / mv) * 100 for tax, mv in zip(est_tax, market_value)]
+    order = sorted(range(len(lots)), key=est_tax_percent.__getitem__)
+
+    retrow_types = [('account', str), ('units', Decimal), ('ticker', str), ('market_value', Decimal),
+                    ('currency', str), ('acq_date', date), ('term', str), ('gain', Decimal)]
+    columns = [lots.column('account'), lots.column('units'), lots.column('ticker'), market_value,
+               lots.column('currency_base'), lots.column('acquisition_date'), term, gain]
+    columns = [[c[i] for i in order] for c in columns]
+    est_tax = [est_tax[i] for i in order]
+
+    # cumulative columns
+    cumu_gains = itertools.accumulate(columns[-1])
+    cumu_proceeds = list(itertools.accumulate(columns[3]))
+    cumu_taxes = list(itertools.accumulate(est_tax))
+    prev_cumu_proceeds = [0] + cumu_proceeds[:-1]
+    prev_cumu_taxes = [0] + cumu_taxes[:-1]
+
+    table = Table([('cu_proceeds', Decimal), ('cu_taxes', Decimal), ('tax_avg', Decimal), ('tax_marg', Decimal)]
+                  + retrow_types,
+                  [[round(cp, 0) for cp in cumu_proceeds],
+                   [round(ct, 0) for ct in cumu_taxes],
+                   [round((ct / cp) * 100, 1) for ct, cp in zip(cumu_taxes, cumu_proceeds)],
+                   [round(((ct - pct) / (cp - pcp)) * 100, 2) for ct, pct, cp, pcp in
+                    zip(cumu_taxes, prev_cumu_taxes, cumu_proceeds, prev_cumu_proceeds)]]
+                  + columns)
+    table.add_column('cu_gains', Decimal, (round(cg, 0) for cg in cumu_gains))
 
-    RetRow = collections.namedtuple('RetRow', [i[0] for i in retrow_types])
-    rrows = []
-    cumu_proceeds = cumu_gains = cumu_taxes = 0
-    prev_cumu_proceeds = prev_cumu_taxes = 0
-    for row in to_sell:
-        cumu_gains += row.gain
-        cumu_proceeds += row.market_value
-        cumu_taxes += row.est_tax
-        tax_rate_avg = (cumu_taxes / cumu_proceeds) * 100
-        tax_rate_marginal = ((cumu_taxes - prev_cumu_taxes) / (cumu_proceeds - prev_cumu_proceeds)) * 100
-        rrows.append(RetRow(round(cumu_proceeds, 0),
-                            round(cumu_taxes, 0),
-                            round(tax_rate_avg, 1),
-                            round(tax_rate_marginal, 2),
-                            *row[:-2],  # Remove est_tax and est_tax_percent
-                            round(cumu_gains, 0)))
-
-        prev_cumu_proceeds = cumu_proceeds
-        prev_cumu_taxes = cumu_taxes
-
-    retrow_types = [r for r in retrow_types if r[0] not in ['est_tax', 'est_tax_percent']]
     # rrows, retrow_types = remove_column('gain', rrows, retrow_types)
     tables = [build_config_table(options)]
-    tables.append(('Proceeds, Gains, Taxes', (retrow_types, rrows, None, None)))
+    tables.append(('Proceeds, Gains, Taxes', table))
     return tables
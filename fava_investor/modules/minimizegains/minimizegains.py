@@ -4,7 +4,62 @@
 import fava_investor.modules.minimizegains.libminimizegains as libmg
 import fava_investor.common.beancountinvestorapi as api
 from fava_investor.common.clicommon import pretty_print_table, write_table_csv
+from beancount.core.number import D
 import click
+import csv
+import decimal
+
+
+def gen_output(accapi, tables=None):
+    if tables is None:
+        config = accapi.get_custom_config('minimizegains')
+        tables = libmg.find_minimized_gains(accapi, config)
+    for title, (rtypes, rrows, _, _) in tables:
+        yield pretty_print_table(title, rtypes, rrows, floatfmt=",.0f")
+
+
+def check_positive(amounts, param_hint):
+    if any(a <= 0 for a in amounts):
+        raise click.BadParameter("amounts must be positive", param_hint=param_hint)
+    return amounts
+
+
+def parse_sweep(sweep):
+    """Parse a comma separated list of amounts, or a start:stop:step range (stop included). Amounts must be
+    positive."""
+    try:
+        if ':' in sweep:
+            start, stop, step = (D(i) for i in sweep.split(':'))
+            if step <= 0:
+                raise click.BadParameter("step must be positive", param_hint='--sweep')
+            amounts = []
+            while start <= stop:
+                amounts.append(start)
+                start += step
+        else:
+            amounts = [D(i) for i in sweep.split(',')]
+    except (ValueError, decimal.InvalidOperation):
+        raise click.BadParameter(f"invalid amounts: {sweep}", param_hint='--sweep')
+    return check_positive(amounts, '--sweep')
+
+
+def read_sweep_file(sweep_file):
+    """Amounts from a csv file with a single column, and an optional header row. Amounts must be positive."""
+    amounts = []
+    for lineno, row in enumerate(csv.reader(sweep_file), 1):
+        if not row:
+            continue
+        try:
+            if len(row) != 1:
+                raise ValueError
+            amounts.append(D(row[0]))
+        except (ValueError, decimal.InvalidOperation):
+            if lineno == 1 and len(row) == 1:
+                continue  # header
+            hint = " (quote amounts with thousands separators)" if len(row) > 1 else ""
+            raise click.BadParameter(f"line {lineno}: expected a single amount, got: {','.join(row)}{hint}",
+                                     param_hint='--sweep-file')
+    return check_positive(amounts, '--sweep-file')
 
 
 @click.command()
@@ -13,8 +68,15 @@ import click
 @click.option('--csv-output', help='In addition to summary, output to minimizegains.csv', is_flag=True)
 @click.option('--amount', help='Compute tax burden for specificed amount. If specified, '
               'instead of printing out a table, the tax, and average and marginal rate for the '
-              'amount will be printed', default=0)
-def minimizegains(beancount_file, brief, csv_output, amount):
+              'amount will be printed. Cannot be combined with --sweep or --sweep-file',
+              type=click.IntRange(min=1))
+@click.option('--sweep', help='Compute tax burden for several amounts at once: either a comma separated list '
+              '(eg: 10000,25000,50000), or a start:stop:step range (eg: 10000:100000:10000). A table of '
+              'amount, tax, and average and marginal rate is printed (or written to minimizegains_sweep.csv '
+              'with --csv-output)')
+@click.option('--sweep-file', type=click.File('r'), help='Like --sweep, but read amounts from a csv file with '
+              'one amount per row, and an optional header row')
+def minimizegains(beancount_file, brief, csv_output, amount, sweep, sweep_file):
     """Finds lots to sell with the lowest gains, to minimize the tax burden of selling.
 
        The BEANCOUNT_FILE environment variable can optionally be set instead of specifying the file on the
@@ -33,15 +95,30 @@ def minimizegains(beancount_file, brief, csv_output, amount):
            }}"
 
     """
+    if amount is not None and (sweep or sweep_file):
+        raise click.UsageError("--amount cannot be combined with --sweep or --sweep-file")
+
     accapi = api.AccAPI(beancount_file, {})
     config = accapi.get_custom_config('minimizegains')
     tables = libmg.find_minimized_gains(accapi, config)
 
-    if amount:
-        proceeds, cu_taxes, tax_avg, tax_marg = libmg.find_tax_burden(tables[1], amount)
+    if amount is not None:
+        burden = libmg.TaxCurve(tables[1]).tax_burden(amount)
+        if burden is None:
+            raise click.BadParameter("exceeds total proceeds from selling all lots", param_hint='--amount')
+        proceeds, cu_taxes, tax_avg, tax_marg = burden
         print(f"{proceeds}, {cu_taxes:.0f}, {tax_avg:.1f}, {tax_marg:.1f}")
         return
 
+    if sweep or sweep_file:
+        amounts = (parse_sweep(sweep) if sweep else []) + (read_sweep_file(sweep_file) if sweep_file else [])
+        title, (rtypes, rrows, _, _) = table = libmg.sweep_tax_burden(tables[1], amounts)
+        if csv_output:
+            write_table_csv('minimizegains_sweep.csv', table)
+        else:
+            click.echo(pretty_print_table(title, rtypes, rrows, floatfmt=",.1f"))
+        return
+
     # TODO:
     # - use same return return API for all of fava_investor
     #   - ordered dictionary of title: [retrow_types, table]
@@ -50,11 +127,7 @@ def minimizegains(beancount_file, brief, csv_output, amount):
     if csv_output:
         write_table_csv('minimizegains.csv', tables[1])
     else:
-        def _gen_output():
-            for title, (rtypes, rrows, _, _) in tables:
-                yield pretty_print_table(title, rtypes, rrows, floatfmt=",.0f")
-
-        click.echo_via_pager(_gen_output())
+        click.echo_via_pager(gen_output(accapi, tables))
 
 
 if __name__ == '__main__':
@@ -1,11 +1,16 @@
 #!/usr/bin/env python3
 
 import beancountinvestorapi as api
+import click
+import io
 import sys
 import os
 from beancount.utils import test_utils
 sys.path.append(os.path.join(os.path.dirname(__file__), '.'))
 import libminimizegains as libmg
+import minimizegains
+from beancount.core.number import Decimal, D
+from fava_investor.common.table import Table
 # To run: pytest
 
 
@@ -41,3 +46,56 @@ class TestScriptCheck(test_utils.TestCase):
         self.assertEqual(2, len(to_sell))
         self.assertEqual(20100, to_sell[0].cu_proceeds)
         self.assertEqual(5100, to_sell[1].cu_taxes)
+
+    @test_utils.docfile
+    def test_tax_burden(self, f):
+        """
+        option "operating_currency" "USD"
+        2010-01-01 open Assets:Investments:Taxable:Brokerage
+        2010-01-01 open Assets:Bank
+
+        2010-01-01 commodity BNCT
+        2010-01-01 commodity COFE
+
+        2015-01-01 * "Buy stock"
+         Assets:Investments:Taxable:Brokerage 100 BNCT {100 USD}
+         Assets:Bank
+
+        2016-01-01 * "Buy stock"
+         Assets:Investments:Taxable:Brokerage 100 COFE {200 USD}
+         Assets:Bank
+
+        2018-01-01 price BNCT 150 USD
+        2018-01-01 price COFE 201 USD
+        """
+        accapi = api.AccAPI(f, {})
+        ret = libmg.find_minimized_gains(accapi, self.options)
+        curve = libmg.TaxCurve(ret[1])
+
+        # cu_proceeds: 20100, 35100. cu_taxes: 100, 5100
+        self.assertEqual((10050, 50), curve.tax_burden(10050)[:2])
+        amount, cu_taxes, tax_avg, tax_marg = curve.tax_burden(27600)
+        self.assertEqual(2600, cu_taxes)
+        self.assertEqual(curve.tax_burden(27600), libmg.find_tax_burden(ret[1], 27600))
+        self.assertIsNone(curve.tax_burden(35100))
+        sweep = libmg.sweep_tax_burden(ret[1], [10050, 27600, 99999])
+        self.assertEqual([10050, 27600], [r.amount for r in sweep[1][1]])
+        self.assertEqual(2600, sweep[1][1][1].cu_taxes)
+
+    def test_tax_curve_unsorted_proceeds(self):
+        # a lot with negative market value makes cu_proceeds drop
+        table = Table([('cu_proceeds', Decimal), ('cu_taxes', Decimal), ('tax_marg', Decimal)],
+                      [[D(100), D(50), D(200)], [D(10), D(5), D(40)], [D(10), D(10), D(20)]])
+        curve = libmg.TaxCurve(('title', table))
+
+        self.assertEqual((0, 0, 0, D(10)), curve.tax_burden(0))
+        # interpolated up to the first row above 90 (as a scan of the table would find), not the last one
+        self.assertEqual((90, D(9)), curve.tax_burden(90)[:2])
+        self.assertEqual(D(20), curve.tax_burden(150)[3])
+        self.assertIsNone(curve.tax_burden(200))
+
+    def test_read_sweep_file(self):
+        self.assertEqual([D(1000), D(2500)], minimizegains.read_sweep_file(io.StringIO('amount\n1000\n\n"2,500"\n')))
+        for bad in ['1000\n-5000\n', '0\n', 'amount\n1,500\n', 'amount\n1000\ntotal\n']:
+            with self.assertRaises(click.BadParameter):
+                minimizegains.read_sweep_file(io.StringIO(bad))
@@ -1,13 +1,12 @@
 #!/bin/env python3
 """Metadata summarizer library for Beancount. See accompanying README.md for documentation."""
 
-import collections
 import re
 import fava_investor.common.libinvestor as libinvestor
 from beancount.core.data import Close
 from beancount.core import realization
 from beancount.core import convert
-from fava_investor.common.libinvestor import build_table_footer
+from fava_investor.common.table import Table
 
 p_leaf = re.compile('^[A-Z0-9]*$')
 
@@ -84,17 +83,18 @@ def build_table(accapi, options):
             if j not in i:
                 i[j] = ''  # TODO: type could be incorrect
 
-    RowTuple = collections.namedtuple('RowTuple', header)
-    rows = [RowTuple(**i) for i in rows]
     rtypes = list(header.items())
+    table = Table(rtypes, [[i[j] for i in rows] for j in header])
 
     # sort by the requested. Default to first column
     sort_col = options.get('sort_by', 0)
     reverse = options.get('sort_reverse', False)
-    rows.sort(key=lambda x: x[sort_col], reverse=reverse)
+    if rows and rtypes:
+        table.sort(rtypes[sort_col][0], reverse=reverse)
 
-    footer = None if 'no_footer' in options else build_table_footer(rtypes, rows, accapi)
-    return options['title'], (rtypes, rows, None, footer)
+    if 'no_footer' not in options:
+        table.build_footer(accapi)
+    return options['title'], table
     # last one is footer
 
 
@@ -174,8 +174,8 @@ def get_balances(accapi):
     """Find all balances"""
 
     currency = accapi.get_operating_currencies()[0]
-    sql = f"SELECT account, SUM(CONVERT(position, '{currency}'))"
-    rtypes, rrows = accapi.query_func(sql)
+    sql = "SELECT account, SUM(CONVERT(position, %(currency)s))"
+    rtypes, rrows = accapi.query_func(sql, {'currency': currency})
 
     if not rtypes:
         return [], {}, [[]]
@@ -7,6 +7,13 @@ import fava_investor.modules.summarizer.libsummarizer as libsummarizer
 from fava_investor.common.clicommon import pretty_print_table
 
 
+def gen_output(accapi):
+    configs = accapi.get_custom_config('summarizer')
+    tables = libsummarizer.build_tables(accapi, configs)
+    for title, (rtypes, rrows, _, _) in tables:
+        yield pretty_print_table(title, rtypes, rrows, floatfmt=",.0f")
+
+
 @click.command()
 @click.argument('beancount-file', type=click.Path(exists=True), envvar='BEANCOUNT_FILE')
 def summarizer(beancount_file):
@@ -31,14 +38,7 @@ def summarizer(beancount_file):
 
     """
     accapi = api.AccAPI(beancount_file, {})
-    configs = accapi.get_custom_config('summarizer')
-    tables = libsummarizer.build_tables(accapi, configs)
-
-    def _gen_output():
-        for title, (rtypes, rrows, _, _) in tables:
-            yield pretty_print_table(title, rtypes, rrows, floatfmt=",.0f")
-
-    click.echo_via_pager(_gen_output())
+    click.echo_via_pager(gen_output(accapi))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+import beancountinvestorapi as api
+import sys
+import os
+from beancount.utils import test_utils
+sys.path.append(os.path.join(os.path.dirname(__file__), '.'))
+import libsummarizer
+# To run: pytest
+
+
+class TestSummarizer(test_utils.TestCase):
+    def setUp(self):
+        self.options = {'title': 'Commodities', 'directive_type': 'commodities', 'columns': ['ticker', 'name']}
+
+    @test_utils.docfile
+    def test_commodities(self, f):
+        """
+        2010-01-01 commodity BNCT
+          name: "Bounce"
+        2010-01-01 commodity ABCD
+          name: "Alphabet"
+        """
+        accapi = api.AccAPI(f, {})
+        title, (rtypes, rrows, _, footer) = libsummarizer.build_table(accapi, self.options)
+
+        self.assertEqual('Commodities', title)
+        self.assertEqual(['ticker', 'name'], [r[0] for r in rtypes])
+        self.assertEqual(['ABCD', 'BNCT'], [r.ticker for r in rrows])
+
+    @test_utils.docfile
+    def test_empty_table(self, f):
+        """
+        2010-01-01 open Assets:Bank
+        """
+        accapi = api.AccAPI(f, {})
+        title, (rtypes, rrows, _, footer) = libsummarizer.build_table(accapi, self.options)
+
+        self.assertEqual('Commodities', title)
+        self.assertEqual([], rrows)
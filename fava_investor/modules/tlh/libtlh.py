@@ -5,19 +5,21 @@ sales, after account for substantially identical funds."""
 import collections
 import locale
 import itertools
-from datetime import datetime
+from datetime import date, datetime
 from dateutil import relativedelta
-from fava_investor.common.libinvestor import val, build_table_footer, insert_column, split_currency
+from fava_investor.common.libinvestor import val, insert_column
+from fava_investor.common.liblots import get_lots, get_account_field
+from fava_investor.common.table import Table
 from beancount.core.number import Decimal, D
 from beancount.core.inventory import Inventory
 
 
 def get_tables(accapi, options):
     retrow_types, to_sell, recent_purchases = find_harvestable_lots(accapi, options)
-    harvestable_table = retrow_types, to_sell
-    by_commodity = harvestable_by_commodity(accapi, options, *harvestable_table)
+    harvestable_table = Table.from_rows(retrow_types, to_sell)
+    by_commodity = Table.from_rows(*harvestable_by_commodity(accapi, options, retrow_types, to_sell))
     summary = summarize_tlh(harvestable_table, by_commodity)
-    recents = build_recents(recent_purchases)
+    recents = Table.from_rows(*build_recents(recent_purchases))
 
     harvestable_table = sort_harvestable_table(harvestable_table, by_commodity)
     return harvestable_table, summary, recents, by_commodity
@@ -25,12 +27,8 @@ def get_tables(accapi, options):
 
 def sort_harvestable_table(harvestable_table, by_commodity):
     """Sort the main table (harvestable_table) in the order of highest to lowest losses."""
-    sort_order = [i.currency for i in by_commodity[1]]
-
-    def order(elem):
-        return sort_order.index(elem.ticker)
-
-    harvestable_table[1].sort(key=order)
+    rank = {currency: i for i, currency in enumerate(by_commodity.column('currency'))}
+    harvestable_table.sort('ticker', key=rank.__getitem__)
     return harvestable_table
 
 
@@ -50,63 +48,18 @@ def get_metavalue(ticker, directives, mlabel):
     # return ','.join(values)
 
 
-def get_account_field(options):
-    """See accompanying README.md"""
-    account_field = options.get('account_field', 'LEAF(account)')
-    try:
-        if isinstance(account_field, int):
-            account_field = ['account',
-                             'LEAF(account)',
-                             'GREPN("(.*):([^:]*):", account, 2)'  # get one-but-leaf account
-                             ][account_field]
-    except ValueError:
-        pass
-    return account_field
-
-
 def find_harvestable_lots(accapi, options):
     """Find tax loss harvestable lots.
     - This is intended for the US, but may be adaptable to other countries.
     - This assumes SpecID (Specific Identification of Shares) is the method used for these accounts
     """
 
-    account_field = get_account_field(options)
-    accounts_pattern = options.get('accounts_pattern', '')
-
-    sql = f"""
-    SELECT {account_field} as account,
-        units(sum(position)) as units,
-        cost_date as acquisition_date,
-        value(sum(position)) as market_value,
-        cost(sum(position)) as basis
-      WHERE account_sortkey(account) ~ "^[01]" AND
-        account ~ '{accounts_pattern}'
-      GROUP BY {account_field}, cost_date, currency, cost_currency, cost_number, account_sortkey(account)
-      ORDER BY account_sortkey(account), currency, cost_date
-    """
-    rtypes, rrows = accapi.query_func(sql)
-    if not rtypes:
-        return [], {}, [[]]
-
-    # Since we GROUP BY cost_date, currency, cost_currency, cost_number, we never expect any of the
-    # inventories we get to have more than a single position. Thus, we can and should use
-    # get_only_position() below. We do this grouping because we are interested in seeing every lot (price,
-    # date) seperately, that can be sold to generate a TLH
-
     loss_threshold = options.get('loss_threshold', 1)
 
-    # our output table is slightly different from our query table:
-    retrow_types = rtypes[:-1] + [('loss', Decimal), ('term', str), ('wash', str)]
-    retrow_types = insert_column(retrow_types, 'units', Decimal, 'ticker', str)
-    retrow_types = insert_column(retrow_types, 'market_value', Decimal, 'currency', str)
-
-    # rtypes:
-    # [('account', <class 'str'>),
-    #  ('units', <class 'beancount.core.inventory.Inventory'>),
-    #  ('acquisition_date', <class 'datetime.date'>),
-    #  ('market_value', <class 'beancount.core.inventory.Inventory'>),
-    #  ('basis', <class 'beancount.core.inventory.Inventory'>)]
-
+    # our output table:
+    retrow_types = [('account', str), ('units', Decimal), ('ticker', str), ('acquisition_date', date),
+                    ('market_value', Decimal), ('currency', str),
+                    ('loss', Decimal), ('term', str), ('wash', str)]
     RetRow = collections.namedtuple('RetRow', [i[0] for i in retrow_types])
 
     # build our output table: calculate losses, find wash sales
@@ -114,21 +67,21 @@ def find_harvestable_lots(accapi, options):
     recent_purchases = {}
     commodities = accapi.get_commodity_directives()
     wash_buy_counter = itertools.count()
+    wash_index = build_wash_index(accapi, options)
 
-    for row in rrows:
-        if row.market_value.get_only_position() and \
-                (val(row.market_value) - val(row.basis) < -loss_threshold):
-            loss = D(val(row.basis) - val(row.market_value))
+    for lot in get_lots(accapi, options):
+        if lot.market_value - lot.basis < -loss_threshold:
+            loss = D(lot.basis - lot.market_value)
 
-            term = gain_term(row.acquisition_date, datetime.today().date())
+            term = gain_term(lot.acquisition_date, datetime.today().date())
 
             # find wash sales
-            units, ticker = split_currency(row.units)
+            ticker = lot.ticker
             recent, wash_id = recent_purchases.get(ticker, (None, None))
             if not recent:
                 identicals = get_metavalue(ticker, commodities, 'a__substidenticals')
                 ticksims = [ticker] + identicals.split(',') if identicals else [ticker]
-                recent = query_recently_bought(ticksims, accapi, options)
+                recent = recently_bought(ticksims, wash_index)
                 wash_id = ''
                 if len(recent[1]):
                     wash_id = next(wash_buy_counter)
@@ -136,8 +89,8 @@ def find_harvestable_lots(accapi, options):
                     recent_purchases[t] = (recent, wash_id)
             wash = wash_id if len(recent[1]) else ''
 
-            to_sell.append(RetRow(row.account, units, ticker, row.acquisition_date,
-                                  *split_currency(row.market_value), loss, term, wash))
+            to_sell.append(RetRow(lot.account, lot.units, ticker, lot.acquisition_date,
+                                  lot.market_value, lot.currency, loss, term, wash))
 
     return retrow_types, to_sell, recent_purchases
 
@@ -174,45 +127,65 @@ def build_recents(recent_purchases):
             rows = [RetRow(*row, wash_id) for row in rows]
             recents += rows
 
-    # dedupe recents
-    recents_dd = []
-    [recents_dd.append(r) for r in recents if r not in recents_dd]
-    return types, recents_dd
+    # dedupe recents: tickers in a group of substantially identicals share their rows, and overlapping
+    # groups may share some too. Rows hold Inventories, which are unhashable, so key on their positions
+    recents_dd = {}
+    for r in recents:
+        key = tuple(frozenset(v) if isinstance(v, Inventory) else v for v in r)
+        recents_dd.setdefault(key, r)
+    return types, list(recents_dd.values())
 
 
-def gen_ticker_expression(tickers):
-    """tickers is either a list, or a comma separated string of one or more tickers"""
-    if isinstance(tickers, str):
-        tickers = tickers.split(',')
-    expr = [f'CURRENCY = "{t}" OR' for t in tickers]
-    expr = ' '.join(expr)
-    expr = expr[:-3]
-    return f"({expr})"
-
-
-def query_recently_bought(tickers, accapi, options):
-    """Looking back 30 days for purchases that would cause wash sales"""
+def build_wash_index(accapi, options):
+    """Find every purchase within the wash sale window (the past 30 days, and any later dated entries) with
+    a single query, and index them by ticker. Looking up the purchases of any group of substantially
+    identical tickers is then a dictionary lookup instead of a query per group."""
 
     wash_pattern = options.get('wash_pattern', '')
     account_field = get_account_field(options)
-    wash_pattern_sql = 'AND account ~ "{}"'.format(wash_pattern) if wash_pattern else ''
-    ticker_expr = gen_ticker_expression(tickers)
+    wash_pattern_sql = 'AND account ~ %(wash_pattern)s' if wash_pattern else ''
     sql = '''
     SELECT
         {account_field} as account,
         date as acquisition_date,
         DATE_ADD(date, 31) as earliest_sale,
         units(sum(position)) as units,
-        cost(sum(position)) as basis
+        cost(sum(position)) as basis,
+        currency
       WHERE
         number > 0 AND
-        date >= DATE_ADD(TODAY(), -30) AND
-        {ticker_expr}
+        date >= DATE_ADD(TODAY(), -30)
         {wash_pattern_sql}
-      GROUP BY {account_field},date,earliest_sale
+      GROUP BY {account_field},date,earliest_sale,currency
       ORDER BY date DESC
       '''.format(**locals())
-    rtypes, rrows = accapi.query_func(sql)
+    rtypes, rrows = accapi.query_func(sql, {'wash_pattern': wash_pattern})
+
+    wash_index = collections.defaultdict(list)
+    for row in rrows:
+        wash_index[row.currency].append(row)
+    return wash_index
+
+
+def recently_bought(tickers, wash_index):
+    """Purchases of any of tickers within the wash sale window, one row per (account, date) like a query
+    grouped by those would return."""
+
+    rtypes = [('account', str), ('acquisition_date', date), ('earliest_sale', date),
+              ('units', Inventory), ('basis', Inventory)]
+    Row = collections.namedtuple('Row', [i[0] for i in rtypes])
+
+    merged = {}
+    for t in tickers:
+        for r in wash_index.get(t, []):
+            key = (r.account, r.acquisition_date, r.earliest_sale)
+            if key not in merged:
+                merged[key] = (Inventory(), Inventory())
+            merged[key][0].add_inventory(r.units)
+            merged[key][1].add_inventory(r.basis)
+
+    rrows = [Row(*key, units, basis) for key, (units, basis) in merged.items()]
+    rrows.sort(key=lambda r: r.acquisition_date, reverse=True)
     return rtypes, rrows
 
 
@@ -221,9 +194,6 @@ def recently_sold_at_loss(accapi, options):
     necessarily so). This tells us what NOT to buy in order to avoid wash sales."""
 
     operating_currencies = accapi.get_operating_currencies_regex()
-    wash_pattern = options.get('wash_pattern', '')
-    account_field = get_account_field(options)
-    wash_pattern_sql = 'AND account ~ "{}"'.format(wash_pattern) if wash_pattern else ''
     sql = '''
     SELECT
         date as sale_date,
@@ -234,12 +204,12 @@ def recently_sold_at_loss(accapi, options):
       WHERE
         date >= DATE_ADD(TODAY(), -30)
         AND number < 0
-        AND not currency ~ "{operating_currencies}"
+        AND not currency ~ %(operating_currencies)s
       GROUP BY sale_date,until,currency
-      '''.format(**locals())
-    rtypes, rrows = accapi.query_func(sql)
+      '''
+    rtypes, rrows = accapi.query_func(sql, {'operating_currencies': operating_currencies})
     if not rtypes:
-        return [], []
+        return Table([])
 
     # filter out losses
     rtypes = insert_column(rtypes, 'currency', None, 'identicals', str)
@@ -256,8 +226,9 @@ def recently_sold_at_loss(accapi, options):
             return_rows.append(RetRow(row.sale_date, row.until, row.currency, identicals, row.basis,
                                       row.proceeds, loss))
 
-    footer = build_table_footer(rtypes, return_rows, accapi)
-    return rtypes, return_rows, None, footer
+    table = Table.from_rows(rtypes, return_rows)
+    table.build_footer(accapi)
+    return table
 
 
 def summarize_tlh(harvestable_table, by_commodity):
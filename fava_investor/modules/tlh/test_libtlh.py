@@ -168,3 +168,42 @@ class TestScriptCheck(test_utils.TestCase):
         self.assertEqual('ORNG', recent_purchases['BNCT'][0][1][0].units.get_only_position().units.currency)
         self.assertEqual(1, len(recents[1]))
         self.assertEqual('ORNG', recents[1][0].units.get_only_position().units.currency)
+
+    @test_utils.docfile
+    @insert_dates
+    def test_wash_index_groups(self, f):
+        """
+        2010-01-01 open Assets:Investments:Taxable:Brokerage
+        2010-01-01 open Assets:Bank
+
+        2010-01-01 commodity BNCT
+          a__substidenticals: "ORNG,PEAR"
+
+        {m100} * "Buy stock"
+         Assets:Investments:Taxable:Brokerage 1 BNCT {{200 USD}}
+         Assets:Bank
+
+        {m10} * "Buy stock"
+         Assets:Investments:Taxable:Brokerage 1 ORNG {{1 USD}}
+         Assets:Investments:Taxable:Brokerage 2 PEAR {{1 USD}}
+         Assets:Bank
+
+        {m5} * "Buy unrelated stock"
+         Assets:Investments:Taxable:Brokerage 1 APPL {{1 USD}}
+         Assets:Bank
+
+        {m1} price BNCT 100 USD
+        """
+        accapi = api.AccAPI(f, {})
+
+        wash_index = libtlh.build_wash_index(accapi, self.options)
+        self.assertEqual({'ORNG', 'PEAR', 'APPL'}, set(wash_index))
+
+        retrow_types, to_sell, recent_purchases = libtlh.find_harvestable_lots(accapi, self.options)
+        recents = libtlh.build_recents(recent_purchases)
+
+        self.assertEqual(1, len(to_sell))
+        self.assertEqual(0, to_sell[0].wash)
+        # ORNG and PEAR bought in the same account on the same day are reported as one purchase
+        self.assertEqual(1, len(recents[1]))
+        self.assertEqual({'ORNG', 'PEAR'}, recents[1][0].units.currencies())
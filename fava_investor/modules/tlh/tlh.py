@@ -7,6 +7,28 @@ from fava_investor.common.clicommon import pretty_print_table
 import click
 
 
+def gen_output(accapi, brief=False):
+    config = accapi.get_custom_config('tlh')
+    harvestable_table, summary, recents, by_commodity = libtlh.get_tables(accapi, config)
+    dontbuy = libtlh.recently_sold_at_loss(accapi, config)
+
+    yield click.style("Summary" + '\n', bg='green', fg='white')
+    for k, v in summary.items():
+        yield "{:30}: {:>}\n".format(k, v)
+    yield '\n'
+    yield pretty_print_table("Losses by commodity", by_commodity[0], by_commodity[1])
+
+    if not brief:
+        yield pretty_print_table("Candidates for tax loss harvesting", harvestable_table[0],
+                                 harvestable_table[1])
+        yield pretty_print_table("What not to sell: recent purchases that would cause wash sales", recents[0],
+                                 recents[1])
+        yield pretty_print_table("What not to buy (sales within the last 30 days with losses)", dontbuy[0], dontbuy[1])
+
+        yield "Note: Turn OFF dividend reinvestment for all these tickers across ALL accounts.\n"
+        yield "See fava plugin for better formatted and sortable output.\n"
+
+
 @click.command()
 @click.argument('beancount-file', type=click.Path(exists=True), envvar='BEANCOUNT_FILE')
 @click.option('--brief', help='Summary output', is_flag=True)
@@ -29,25 +51,7 @@ def tlh(beancount_file, brief):
 
     """
     accapi = api.AccAPI(beancount_file, {})
-    config = accapi.get_custom_config('tlh')
-    harvestable_table, summary, recents, by_commodity = libtlh.get_tables(accapi, config)
-    dontbuy = libtlh.recently_sold_at_loss(accapi, config)
-
-    def _gen_output():
-        yield click.style("Summary" + '\n', bg='green', fg='white')
-        for k, v in summary.items():
-            yield "{:30}: {:>}\n".format(k, v)
-        yield '\n'
-        yield pretty_print_table("Losses by commodity", *by_commodity)
-
-        if not brief:
-            yield pretty_print_table("Candidates for tax loss harvesting", *harvestable_table)
-            yield pretty_print_table("What not to sell: recent purchases that would cause wash sales", *recents)
-            yield pretty_print_table("What not to buy (sales within the last 30 days with losses)", dontbuy[0], dontbuy[1])
-
-            yield "Note: Turn OFF dividend reinvestment for all these tickers across ALL accounts.\n"
-            yield "See fava plugin for better formatted and sortable output.\n"
-    click.echo_via_pager(_gen_output())
+    click.echo_via_pager(gen_output(accapi, brief))
 
 
 if __name__ == '__main__':
@@ -1,55 +1,234 @@
 #!/usr/bin/env python3
-import asyncio
+"""Ticker info downloaded from Yahoo, cached in a SQLite database with one row per ticker. Each ticker is
+read and written on its own, so listing a few tickers doesn't load all of them, and concurrent runs each
+update only the tickers they downloaded."""
+
+import concurrent.futures
+import json
 import os
 import pickle
 import datetime
-import yfinance as yf
+import shutil
+import sqlite3
+import sys
+import threading
+import time
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+DAY = 24 * 60 * 60
+
+# Days after which downloaded info goes stale (see stale_tickers()), for fields that change over time. A
+# ticker goes stale as soon as its shortest lived field does. Other fields (names, ISINs, etc.) rarely change,
+# and use DEFAULT_TTL
+FIELD_TTLS = {
+    'annualReportExpenseRatio': 90,
+    'bondPosition': 30,
+    'cashPosition': 30,
+    'convertiblePosition': 30,
+    'otherPosition': 30,
+    'preferredPosition': 30,
+    'stockPosition': 30,
+}
+DEFAULT_TTL = 365
+
+
+class RateLimiter:
+    """Spaces out calls across threads, to at most `rate` per second. A rate of 0 disables limiting."""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate else 0
+        self.next_call = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
 
 
 class CachedTickerInfo:
-    def __init__(self, cache_file):
+    def __init__(self, cache_file, ticker_class=None):
+        """ticker_class is called with a ticker to look it up, and must provide the `info` and `isin`
+        attributes of yfinance.Ticker, which is the default (tests substitute a stub)"""
         self.cache_file = cache_file
-        if not os.path.exists(self.cache_file):
-            with open(self.cache_file, 'wb') as f:
-                pickle.dump({}, f)
+        self.ticker_class = ticker_class
+
+        if os.path.exists(self.cache_file):
+            with open(self.cache_file, 'rb') as f:
+                if f.read(len(SQLITE_HEADER)) != SQLITE_HEADER:
+                    self.migrate_pickle()
+        self.db = self.connect(self.cache_file)
+
+    @staticmethod
+    def connect(db_file):
+        db = sqlite3.connect(db_file, timeout=30)
+        with db:
+            # ttl: days after which this ticker goes stale, overriding FIELD_TTLS (NULL: use FIELD_TTLS)
+            db.execute('CREATE TABLE IF NOT EXISTS tickers '
+                       '(ticker TEXT PRIMARY KEY, info TEXT NOT NULL, fetched REAL NOT NULL, ttl REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS tickers_fetched ON tickers (fetched)')
+            if 'ttl' not in [c[1] for c in db.execute('PRAGMA table_info(tickers)')]:
+                db.execute('ALTER TABLE tickers ADD COLUMN ttl REAL')
+        return db
+
+    def migrate_pickle(self):
+        """Caches used to be a single pickled dict. Convert one into a database in place, keeping a copy of the
+        original as <cache_file>.pickle. Tickers are marked as fetched when the pickle was last written. The
+        database is built aside and then moved over the pickle, so an interrupted migration leaves the
+        pickle as it was."""
         with open(self.cache_file, 'rb') as f:
             data = pickle.load(f)
-        # print(self.get_cache_last_updated())
-        self.data = data
+        fetched = os.path.getmtime(self.cache_file)
+
+        tmp_file = self.cache_file + '.migrating'
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        db = self.connect(tmp_file)
+        with db:
+            db.executemany('INSERT INTO tickers (ticker, info, fetched) VALUES (?, ?, ?)',
+                           [(t, json.dumps(info, default=str), fetched) for t, info in data.items()])
+        db.close()
+
+        shutil.copy2(self.cache_file, self.cache_file + '.pickle')
+        os.replace(tmp_file, self.cache_file)
+        print(f"Migrated {len(data)} tickers to a database. The old cache is in {self.cache_file}.pickle",
+              file=sys.stderr)
 
     def get_cache_last_updated(self):
-        cache_file_updated = os.path.getmtime(self.cache_file)
+        """When a ticker was last downloaded, as an ISO timestamp (None if the cache is empty)"""
+        last, = self.db.execute('SELECT MAX(fetched) FROM tickers').fetchone()
+        if last is None:
+            return None
         tz = datetime.datetime.now().astimezone().tzinfo
-        self.cache_last_updated = datetime.datetime.fromtimestamp(cache_file_updated, tz).isoformat()
+        self.cache_last_updated = datetime.datetime.fromtimestamp(last, tz).isoformat()
         return self.cache_last_updated
 
-    def lookup_yahoo(self, ticker):
-        t_obj = yf.Ticker(ticker)
-
-        print("Downloading info for", ticker)
-        self.data[ticker] = t_obj.info
-        self.data[ticker]['isin'] = t_obj.isin
-        if self.data[ticker]['isin'] == '-':
-            self.data[ticker].pop('isin')
-        if 'annualReportExpenseRatio' in self.data[ticker]:
-            er = self.data[ticker]['annualReportExpenseRatio']
-            if er:
-                self.data[ticker]['annualReportExpenseRatio'] = round(er * 100, 2)
+    def __contains__(self, ticker):
+        return self.db.execute('SELECT 1 FROM tickers WHERE ticker = ?', (ticker,)).fetchone() is not None
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM tickers').fetchone()[0]
 
-    def write_cache(self):
-        with open(self.cache_file, 'wb') as f:
-            pickle.dump(self.data, f)
+    def tickers(self):
+        return [t for t, in self.db.execute('SELECT ticker FROM tickers ORDER BY ticker')]
+
+    def get(self, ticker, default=None):
+        row = self.db.execute('SELECT info FROM tickers WHERE ticker = ?', (ticker,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def get_many(self, tickers):
+        """Info of those of the given tickers that are in the cache, as a dict"""
+        tickers = list(tickers)
+        retval = {}
+        for i in range(0, len(tickers), 500):  # stay well under SQLite's limit on the number of parameters
+            chunk = tickers[i:i + 500]
+            rows = self.db.execute('SELECT ticker, info FROM tickers WHERE ticker IN ({})'.format(
+                                   ','.join('?' * len(chunk))), chunk)
+            retval.update((t, json.loads(info)) for t, info in rows)
+        return retval
+
+    def items(self):
+        """All (ticker, info) pairs, sorted by ticker. Prefer get_many() when only some tickers are needed."""
+        for ticker, info in self.db.execute('SELECT ticker, info FROM tickers ORDER BY ticker'):
+            yield ticker, json.loads(info)
+
+    def put(self, ticker, info, fetched=None):
+        with self.db:
+            self.db.execute('INSERT INTO tickers (ticker, info, fetched) VALUES (?, ?, ?) '
+                            'ON CONFLICT (ticker) DO UPDATE SET info = excluded.info, fetched = excluded.fetched',
+                            (ticker, json.dumps(info, default=str), time.time() if fetched is None else fetched))
+
+    def set_ttl(self, ticker, ttl):
+        """Make ticker go stale `ttl` days after it is fetched, regardless of its fields. None reverts to
+        FIELD_TTLS."""
+        with self.db:
+            self.db.execute('UPDATE tickers SET ttl = ? WHERE ticker = ?', (ttl, ticker))
+
+    def stale_tickers(self, field_ttls=FIELD_TTLS, default_ttl=DEFAULT_TTL, now=None):
+        """Tickers whose info has expired: those fetched more than their ttl days ago (see set_ttl()), or
+        failing that, more than the shortest of field_ttls of the fields they have (default_ttl if none)."""
+        now = time.time() if now is None else now
+        min_ttl, = self.db.execute('SELECT MIN(ttl) FROM tickers').fetchone()
+        min_ttl = min(list(field_ttls.values()) + [default_ttl] + ([min_ttl] if min_ttl is not None else []))
+
+        # Only tickers older than the shortest ttl can be stale. The index on fetched finds those, so only
+        # their info has to be read
+        stale = []
+        for ticker, info, fetched, ttl in self.db.execute('SELECT ticker, info, fetched, ttl FROM tickers '
+                                                          'WHERE fetched < ? ORDER BY ticker',
+                                                          (now - min_ttl * DAY,)):
+            if ttl is None:
+                ttl = min([field_ttls[f] for f in json.loads(info) if f in field_ttls] + [default_ttl])
+            if fetched < now - ttl * DAY:
+                stale.append(ticker)
+        return stale
 
     def remove(self, ticker):
-        self.data.pop(ticker, None)
-        self.write_cache()
-
-    def batch_lookup(self, tickers):
-        async def download():
-            loop = asyncio.get_running_loop()
-            tickers_to_lookup = [t for t in tickers if t not in self.data]
-            tasks = [loop.run_in_executor(None, self.lookup_yahoo, ticker) for ticker in tickers_to_lookup]
-            await asyncio.gather(*tasks)
-
-        asyncio.run(download())
-        self.write_cache()
+        with self.db:
+            self.db.execute('DELETE FROM tickers WHERE ticker = ?', (ticker,))
+
+    def fetch_yahoo(self, ticker):
+        """Download and return info for ticker. Does not touch the cache, so is safe to call from any thread."""
+        if self.ticker_class is None:
+            import yfinance  # slow to import, and only needed to download
+            self.ticker_class = yfinance.Ticker
+        t_obj = self.ticker_class(ticker)
+
+        info = dict(t_obj.info)
+        info['isin'] = t_obj.isin
+        if info['isin'] == '-':
+            info.pop('isin')
+        if 'annualReportExpenseRatio' in info:
+            er = info['annualReportExpenseRatio']
+            if er:
+                info['annualReportExpenseRatio'] = round(er * 100, 2)
+        return info
+
+    def lookup_yahoo(self, ticker):
+        self.put(ticker, self.fetch_yahoo(ticker))
+
+    def fetch_with_retries(self, ticker, limiter, retries, backoff):
+        """Download ticker, retrying failures up to `retries` times, waiting backoff, 2*backoff, 4*backoff, ...
+        seconds between attempts. Returns (info, None) on success, or (None, the last exception)."""
+        for attempt in range(retries + 1):
+            limiter.wait()
+            try:
+                return self.fetch_yahoo(ticker), None
+            except Exception as e:
+                error = e
+                if attempt < retries:
+                    time.sleep(backoff * 2 ** attempt)
+        return None, error
+
+    def batch_lookup(self, tickers, concurrency=8, rate=4, retries=3, backoff=1.0, progress=True, refetch=False):
+        """Download info for the tickers not already in the cache (all of them if refetch), with up to
+        `concurrency` lookups in flight and at most `rate` started per second. Each ticker is retried on failure
+        (see fetch_with_retries()). A ticker that still fails does not stop the others, and keeps any info
+        cached earlier: each download is stored as soon as it completes. Returns a dict of the tickers that
+        failed, and their last error."""
+        cached = set() if refetch else set(self.tickers())
+        tickers_to_lookup = [t for t in dict.fromkeys(tickers) if t not in cached]
+        limiter = RateLimiter(rate)
+        failed = {}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {executor.submit(self.fetch_with_retries, ticker, limiter, retries, backoff): ticker
+                       for ticker in tickers_to_lookup}
+            # downloads run in worker threads, but are stored from this one (sqlite connections can't be
+            # shared across threads)
+            for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+                ticker = futures[future]
+                info, error = future.result()
+                if error:
+                    failed[ticker] = error
+                else:
+                    self.put(ticker, info)
+                if progress:
+                    status = f'failed: {error}' if error else 'ok'
+                    print(f'[{done}/{len(tickers_to_lookup)}] {ticker}: {status}', file=sys.stderr)
+        return failed
@@ -31,15 +31,17 @@ Misc notes:
 """
 
 import click
+import collections
 import os
 import statistics
+import sys
 import datetime
 
-from beancount.core import getters
 from beancount.core.data import Price
 from beancount.core.amount import Amount
 from beancount.parser import printer
 from fava_investor.util.relatetickers import RelateTickers
+from fava_investor.util import lightloader
 
 
 cf_option = click.option('--cf', '--commodities-file', help="Beancount commodity declarations file",
@@ -49,29 +51,58 @@ prices_option = click.option('--pf', '--prices-file', help="Beancount prices dec
 
 
 class ScaledNAV(RelateTickers):
-    def __init__(self, cf, prices_file, date=None):
+    def __init__(self, cf, prices_file, date=None, window=None, full_load=False):
+        """window: only consider prices from these many days before date. full_load: read the prices file
+        with the full beancount loader instead of the lightweight price-only reader."""
         self.cf = cf
         self.prices_file = prices_file
         self.date = date
-        entries, _, _ = self.load_file(cf)
-
         # basic databases
-        self.db = getters.get_commodity_directives(entries)
+        self.db = self.load_commodities(cf)
 
         # identicals databases
         self.identicals = self.build_commodity_groups(['a__equivalents', 'a__substidenticals'])
 
         # prices database
-        entries, _, _ = self.load_file(prices_file)
-        self.price_entries = [entry for entry in entries if isinstance(entry, Price)]
-        self.price_entries = sorted(self.price_entries, key=lambda x: x.date)
         if not date:
             date = datetime.datetime.today().date()
-        self.latest_prices = {p.currency: p.amount for p in self.price_entries if p.date == date}
+        since = date - datetime.timedelta(days=window) if window else None
+        if not full_load:
+            try:
+                self.prices = self.build_price_index(lightloader.read_prices(prices_file, since))
+            except ValueError as e:
+                print(f"{e}. Falling back to the full beancount loader.", file=sys.stderr)
+                full_load = True
+        if full_load:
+            self.prices = self.build_price_index(self.load_prices(prices_file, since))
+        self.latest_prices = {c: prices[date] for c, prices in self.prices.items() if date in prices}
         self.estimate_mf_navs()
         # for k, v in self.latest_prices.items():
         #     print(k, v)
 
+    def load_prices(self, prices_file, since=None):
+        """Same as lightloader.read_prices(), but via the full beancount loader."""
+        entries, _, _ = self.load_file(prices_file)
+        for p in entries:
+            if isinstance(p, Price) and (since is None or p.date >= since):
+                yield p.date, p.currency, p.amount.number, p.amount.currency
+
+    @staticmethod
+    def build_price_index(prices):
+        """Index (date, currency, number, quote_currency) tuples by currency, and then by date:
+        {currency: {date: amount}}. As in beancount, the last price for a given day wins."""
+        index = collections.defaultdict(dict)
+        for date, currency, number, quote_currency in prices:
+            index[currency][date] = Amount(number, quote_currency)
+        return index
+
+    def price_ratios(self, mf, etf):
+        """List of (date, mf_price/etf_price) for every date both have a price on, sorted by date."""
+        mf_prices = self.prices.get(mf, {})
+        etf_prices = self.prices.get(etf, {})
+        common_dates = sorted(mf_prices.keys() & etf_prices.keys())
+        return [(d, mf_prices[d].number / etf_prices[d].number) for d in common_dates]
+
     def is_etf(self, ticker):
         try:
             return self.db[ticker].meta['a__quoteType'] == 'ETF'
@@ -105,22 +136,12 @@ class ScaledNAV(RelateTickers):
         scaled_mf = {}
         unavailable_etfs = set()
         for mf, etf in mf_to_etfs.items():
-            ratios = []
-            for p in self.price_entries:
-                if p.currency == mf:
-                    etf_prices = [x for x in self.price_entries if (x.currency == etf and x.date == p.date)]
-                    if etf_prices:
-                        mf_price = p.amount.number
-                        etf_price = etf_prices[0].amount.number
-                        ratio = mf_price / etf_price
-                        # print("  ", p.date, mf_price, etf_price, ratio)
-                        ratios.append((p.date, ratio))
+            ratios = self.price_ratios(mf, etf)
             if ratios:
                 if etf in self.latest_prices:
                     # consider only the most recent 10 values, because some ETFs and MFs that are
                     # not share classes of each other can diverge due to how they pay dividends and
                     # capgain distributions (eg: VINIX vs VOO)
-                    ratios.sort(key=lambda x: x[0])
                     ratios = ratios[-10:]
                     ratios = [i[1] for i in ratios]
                     median_ratio = statistics.median(ratios)
@@ -153,7 +174,11 @@ class ScaledNAV(RelateTickers):
 @prices_option
 @click.option('--date', help="Date", default=datetime.datetime.today().date())
 @click.option('-w', '--write-to-prices-file', is_flag=True, help='Append estimates to prices file.')
-def scaled_navs(cf, pf, date, write_to_prices_file):
+@click.option('--window', type=int, default=None, help='Only read prices from these many days before the date. '
+              'Keeps memory bounded on long price histories. Default: read all prices')
+@click.option('--full-load', is_flag=True, help='Read the prices file with the full beancount loader instead of '
+              'the lightweight price-only reader')
+def scaled_navs(cf, pf, date, write_to_prices_file, window, full_load):
     """Provide scaled price estimates for mutual funds based on their ETF prices. Experimental.
 
 \nWARNING: it may be dangerous to use this tool financially. You bear all liability for all losses stemming
@@ -165,7 +190,7 @@ from usage of this tool.
     """
     if isinstance(date, str):
         date = datetime.datetime.strptime(date, "%Y-%m-%d").date()
-    s = ScaledNAV(cf, pf, date=date)
+    s = ScaledNAV(cf, pf, date=date, window=window, full_load=full_load)
     s.show_estimates()
     if write_to_prices_file:
         s.update_prices_file()
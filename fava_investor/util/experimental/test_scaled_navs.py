@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+
+import datetime
+import os
+import sys
+import tempfile
+import unittest
+from beancount.core.amount import Amount
+from beancount.core.number import D
+sys.path.append(os.path.join(os.path.dirname(__file__), '.'))
+from scaled_navs import ScaledNAV
+
+
+class TestScaledNAV(unittest.TestCase):
+    commodities = """
+2005-01-01 commodity VFIAX
+  a__quoteType: "MUTUALFUND"
+  a__equivalents: "VOO"
+
+2005-01-01 commodity VOO
+  a__quoteType: "ETF"
+"""
+
+    # 01-02: both funds. 01-03: only VFIAX. 01-04: only VOO. 01-05: both, with two VFIAX prices
+    prices = """
+2024-01-02 price VFIAX 400 USD
+2024-01-02 price VOO   200 USD
+2024-01-03 price VFIAX 410 USD
+2024-01-04 price VOO   210 USD
+2024-01-05 price VFIAX 999 USD
+2024-01-05 price VOO   220 USD
+2024-01-05 price VFIAX 440 USD
+"""
+
+    def test_ratios_and_latest_prices(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cf = os.path.join(tmpdir, 'commodities.beancount')
+            pf = os.path.join(tmpdir, 'prices.beancount')
+            with open(cf, 'w') as f:
+                f.write(self.commodities)
+            with open(pf, 'w') as f:
+                f.write(self.prices)
+
+            for full_load in [False, True]:
+                snav = ScaledNAV(cf, pf, date=datetime.date(2024, 1, 5), full_load=full_load)
+
+                # only dates both funds have a price on. On a day with several prices, the last one wins
+                self.assertEqual([(datetime.date(2024, 1, 2), D(2)), (datetime.date(2024, 1, 5), D(2))],
+                                 snav.price_ratios('VFIAX', 'VOO'))
+                self.assertEqual({'VFIAX': Amount(D(440), 'USD'), 'VOO': Amount(D(220), 'USD')},
+                                 snav.latest_prices)
+                self.assertEqual([Amount(D(440), 'USD')], [p.amount for p in snav.estimated_price_entries])
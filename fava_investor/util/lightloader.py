@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""Lightweight readers for Beancount files that contain only one kind of directive.
+
+beancount.loader.load_file() parses, books, validates, and runs plugins on the whole file. For files that are
+known to hold only price (or commodity) declarations, that is wasted work: these readers scan the file line
+by line and pick out just the directives we need. Use the full loader for anything more complex.
+"""
+
+import datetime
+import glob
+import os
+import re
+import sys
+from beancount import loader
+from beancount.core import data, getters
+from beancount.core.number import D
+
+DATE = r'(\d{4}[-/]\d{2}[-/]\d{2})'
+CURRENCY = r"([A-Z][A-Z0-9'._-]*)"
+p_price = re.compile(rf'^{DATE}\s+price\s+{CURRENCY}\s+([-+]?[0-9,]*\.?[0-9]+)\s+{CURRENCY}\s*(;.*)?$')
+p_price_like = re.compile(rf'^{DATE}\s+price\s')
+p_include = re.compile(r'^include\s+"([^"]*)"')
+p_commodity = re.compile(rf'^{DATE}\s+commodity\s+{CURRENCY}\s*(;.*)?$')
+p_commodity_like = re.compile(rf'^{DATE}\s+commodity\s')
+p_dated = re.compile(rf'^{DATE}\s')
+p_meta = re.compile(r'^[ \t]+([a-z][a-zA-Z0-9_-]+):(.*)$')
+p_meta_string = re.compile(r'^"([^"\\]*)"\s*(;.*)?$')
+p_meta_date = re.compile(rf'^{DATE}$')
+p_meta_number = re.compile(r'^[-+]?[0-9][0-9,]*(\.[0-9]*)?$')
+p_meta_name = re.compile(r"^([A-Z][A-Z0-9'._-]*|[A-Z][A-Za-z0-9-]*(:[A-Z0-9][A-Za-z0-9-]*)+)$")  # currency, account
+
+
+def parse_date(s):
+    return datetime.date(int(s[0:4]), int(s[5:7]), int(s[8:10]))
+
+
+def included_files(filename, line):
+    """Files included by line, if it is an include directive in filename, in the order beancount reads them"""
+    m = p_include.match(line)
+    if not m:
+        return []
+    pattern = os.path.join(os.path.dirname(os.path.abspath(filename)), m.group(1))
+    return sorted(glob.glob(pattern))
+
+
+def read_prices(filename, since=None):
+    """Yield (date, currency, number, quote_currency) for every price directive in filename, in file
+    order, following include directives. If since is given, skip prices dated before it.
+
+    Raises ValueError on a price directive this reader cannot parse (eg: one using an arithmetic
+    expression), so callers can fall back to the full loader."""
+
+    with open(filename) as f:
+        for lineno, line in enumerate(f, 1):
+            m = p_price.match(line)
+            if m:
+                date = parse_date(m.group(1))
+                if since is None or date >= since:
+                    yield date, m.group(2), D(m.group(3)), m.group(4)
+                continue
+
+            if p_price_like.match(line):
+                raise ValueError(f"{filename}:{lineno}: unable to parse price directive: {line.strip()}")
+
+            for included in included_files(filename, line):
+                yield from read_prices(included, since)
+
+
+def parse_meta_value(value):
+    """Parse a metadata value of the kinds found in commodity declarations. Raises ValueError on others."""
+    value = value.strip()
+    if value.startswith('"'):
+        m = p_meta_string.match(value)  # no escapes or multi-line strings: leave those to the full loader
+        if not m:
+            raise ValueError(f"unable to parse string: {value}")
+        return m.group(1)
+
+    value = value.split(';')[0].strip()
+    if not value:
+        return None
+    if value in ('TRUE', 'FALSE'):
+        return value == 'TRUE'
+    if p_meta_date.match(value):
+        return parse_date(value)
+    if p_meta_number.match(value):
+        return D(value)
+    if p_meta_name.match(value):
+        return value
+    raise ValueError(f"unable to parse value: {value}")
+
+
+def add_meta(entry, line, filename, lineno):
+    """Add the metadata on an indented line to entry"""
+    m = p_meta.match(line)
+    if not m:
+        raise ValueError(f"{filename}:{lineno}: unable to parse metadata: {line.strip()}")
+    try:
+        entry.meta[m.group(1)] = parse_meta_value(m.group(2))
+    except ValueError as e:
+        raise ValueError(f"{filename}:{lineno}: {e}") from None
+
+
+def read_commodity_entries(filename):
+    """Yield a Commodity entry, with its metadata, for every commodity directive in filename, following include
+    directives. Other directives are skipped.
+
+    Raises ValueError on anything this reader cannot parse the way the full loader would (eg: escaped strings,
+    or pushmeta), so callers can fall back to it."""
+
+    filename = os.path.abspath(filename)
+    entry = None
+    with open(filename) as f:
+        for lineno, line in enumerate(f, 1):
+            if line[:1] in (' ', '\t') and line.strip():
+                # skip comments, and what is indented under other directives (eg: postings)
+                if entry is not None and not line.lstrip().startswith(';'):
+                    add_meta(entry, line, filename, lineno)
+                continue
+
+            # as in beancount, any unindented or blank line ends the directive's metadata
+            if entry is not None:
+                yield entry
+                entry = None
+
+            m = p_commodity.match(line)
+            if m:
+                entry = data.Commodity({'filename': filename, 'lineno': lineno}, parse_date(m.group(1)),
+                                       m.group(2))
+                continue
+
+            if p_commodity_like.match(line) or line.startswith('pushmeta'):
+                raise ValueError(f"{filename}:{lineno}: unable to parse: {line.strip()}")
+
+            for included in included_files(filename, line):
+                yield from read_commodity_entries(included)
+    if entry is not None:
+        yield entry
+
+
+def read_commodities(filename):
+    """Commodity directives in filename, by currency, the same as getters.get_commodity_directives() returns
+    after a full load (which orders entries by date, and then by line number). Ignores plugins. Raises
+    ValueError like read_commodity_entries()."""
+    entries = sorted(read_commodity_entries(filename), key=lambda e: (e.date, e.meta['lineno']))
+    return {e.currency: e for e in entries}
+
+
+def load_commodities(filename):
+    """read_commodities(), falling back to the full beancount loader on files it cannot parse"""
+    try:
+        return read_commodities(filename)
+    except ValueError as e:
+        print(f"{e}. Falling back to the full beancount loader.", file=sys.stderr)
+        entries, _, _ = loader.load_file(filename)
+        return getters.get_commodity_directives(entries)
@@ -6,35 +6,49 @@ from collections import defaultdict
 import itertools
 
 from beancount import loader
-from beancount.core import getters
+from fava_investor.util import lightloader
 
 
 class RelateTickers:
     def __init__(self, cf):
-        entries, _, _ = self.load_file(cf)
-
         # basic databases
-        self.db = getters.get_commodity_directives(entries)
+        self.db = self.load_commodities(cf)
         self.archived = [c for c in self.db if 'archive' in self.db[c].meta]
+        self.archived_set = set(self.archived)
 
         # equivalents and identicals databases
         self.equis = self.build_commodity_groups(['a__equivalents'])
         self.idents = self.build_commodity_groups(['a__equivalents', 'a__substidenticals'])
-        identscopy = [i.copy() for i in self.idents]
-        self.idents_preferred = {i.pop(): i for i in identscopy}
+        # the alphabetically first ticker represents each group, so that output is the same across runs
+        self.idents_preferred = {min(i): i - {min(i)} for i in self.idents}
 
-    def load_file(self, cf):
+        # ticker -> group indexes, so lookups don't have to scan every group
+        self.equis_index = {t: group for group in self.equis for t in group}
+        self.idents_index = {t: group for group in self.idents for t in group}
+        self.representatives = {t: k for k, v in self.idents_preferred.items() for t in v}
+        self.representatives.update({k: k for k in self.idents_preferred})
+
+    @staticmethod
+    def check_file(cf):
         if cf is None:
             print("File not specified. See help.", file=sys.stderr)
             sys.exit(1)
         if not os.path.exists(cf):
             print(f"File not found: {cf}", file=sys.stderr)
             sys.exit(1)
+
+    def load_file(self, cf):
+        self.check_file(cf)
         return loader.load_file(cf)
 
+    def load_commodities(self, cf):
+        """Commodity directives in cf, by currency. Reads just those (see lightloader), which is much faster
+        than a full load of a large commodities file."""
+        self.check_file(cf)
+        return lightloader.load_commodities(cf)
+
     def non_archived_set(self, s):
-        removes = [c for c in s if c in self.archived]
-        return [i for i in s if i not in removes]
+        return [i for i in s if i not in self.archived_set]
 
     def non_archived_los(self, listofsets):
         """Filter out archived commodities from a list of sets."""
@@ -62,10 +76,9 @@ class RelateTickers:
             retval = [self.substidenticals(t) for t in ticker]
             return set([j for i in retval for j in i])
 
-        equivalence_group = self.equis if equivalents_only else self.idents
-        for group in equivalence_group:
-            if ticker in group:
-                return self.pretty_sort([g for g in group if g != ticker])
+        index = self.equis_index if equivalents_only else self.idents_index
+        if ticker in index:
+            return self.pretty_sort([g for g in index[ticker] if g != ticker])
         return []
 
     def representative(self, ticker):
@@ -76,44 +89,37 @@ class RelateTickers:
         This method also accepts a list or set, and returns a list of representative tickers for
         each ticker in the list or set."""
 
-        db = self.idents_preferred
         if isinstance(ticker, list):
             return [self.representative(t) for t in ticker]
 
         if isinstance(ticker, set):
             return set([self.representative(t) for t in ticker])
 
-        if ticker in db:
-            return ticker
-        for k in db:
-            if ticker in db[k]:
-                return k
-        return ticker
+        return self.representatives.get(ticker, ticker)
 
     def build_commodity_groups(self, metas, only_non_archived=False):
-        """Find equivalent sets."""
+        """Find equivalent sets: commodities related to each other, directly or transitively, via any of the
+        given metadata labels. Uses union-find, so this is near linear in the number of commodities."""
 
-        retval = []
+        parent = {}
+
+        def find(t):
+            parent.setdefault(t, t)
+            while parent[t] != t:
+                parent[t] = parent[parent[t]]  # path halving
+                t = parent[t]
+            return t
 
         for c in self.db:
-            equis = set()
             for m in metas:
-                equis.update(self.db[c].meta.get(m, '').split(','))
-            if '' in equis:
-                equis.remove('')
-            if not equis:
-                continue
-            equis.add(c)
-            added = False
-            for e in equis:
-                for r in retval:
-                    if e in r:
-                        r = r.update(equis)
-                        added = True
-                        break
-
-            if not added:
-                retval.append(set(equis))
+                for e in self.db[c].meta.get(m, '').split(','):
+                    if e:
+                        parent[find(e)] = find(c)
+
+        groups = {}
+        for t in parent:
+            groups.setdefault(find(t), set()).add(t)
+        retval = list(groups.values())
 
         if only_non_archived:
             return self.non_archived_los(retval)
@@ -123,13 +129,13 @@ class RelateTickers:
         """Sort, and optionally group substantially identical tickers together.
            Input: list of tickers, or a comma separated string of tickers
 
-           Note: this is a partial ordering, and will therefore produce different (but valid)
-           results across different runs for the same input
-
+           Groups are ordered by their representative, and tickers within a group by length (longest first),
+           then by name, so the same input always produces the same output.
         """
 
         if isinstance(tickers, str):
             tickers = tickers.split(',')
+        tickers.sort()
         tickers.sort(key=len, reverse=True)
         tickers.sort(key=lambda x: self.representative(x))
 
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import pickle
+import tempfile
+import time
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), '.'))
+from cachedtickerinfo import CachedTickerInfo, DAY
+
+
+class StubTicker:
+    """Stands in for yfinance.Ticker. Lookups of tickers in `failures` raise that many times, then succeed."""
+    failures = {}
+    calls = []
+
+    def __init__(self, ticker):
+        StubTicker.calls.append(ticker)
+        if StubTicker.failures.get(ticker, 0):
+            StubTicker.failures[ticker] -= 1
+            raise ConnectionError(f'{ticker}: too many requests')
+        self.info = {'symbol': ticker, 'annualReportExpenseRatio': 0.0004}
+        self.isin = '-'
+
+
+class TestBatchLookup(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.tmpdir.name, 'cache')
+        StubTicker.calls = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_retries_and_partial_success(self):
+        StubTicker.failures = {'B': 2, 'C': 10}
+        ctdata = CachedTickerInfo(self.cache_file, ticker_class=StubTicker)
+        failed = ctdata.batch_lookup(['A', 'B', 'C', 'A'], concurrency=2, rate=0, retries=3, backoff=0,
+                                     progress=False)
+
+        self.assertEqual(['C'], list(failed))
+        self.assertEqual({'A': 1, 'B': 3, 'C': 4}, {t: StubTicker.calls.count(t) for t in 'ABC'})
+        self.assertEqual({'symbol': 'A', 'annualReportExpenseRatio': 0.04}, ctdata.get('A'))
+
+        # what succeeded was written to the cache, and is not downloaded again
+        ctdata = CachedTickerInfo(self.cache_file, ticker_class=StubTicker)
+        self.assertEqual(['A', 'B'], ctdata.tickers())
+        StubTicker.calls = []
+        StubTicker.failures = {}
+        self.assertEqual({}, ctdata.batch_lookup(['A', 'B', 'C'], rate=0, backoff=0, progress=False))
+        self.assertEqual(['C'], StubTicker.calls)
+
+    def test_migrate_pickle(self):
+        with open(self.cache_file, 'wb') as f:
+            pickle.dump({'VTI': {'symbol': 'VTI', 'isin': 'US9229087690'}, 'VXUS': {'symbol': 'VXUS'}}, f)
+
+        ctdata = CachedTickerInfo(self.cache_file, ticker_class=StubTicker)
+        self.assertEqual(['VTI', 'VXUS'], ctdata.tickers())
+        self.assertEqual({'VTI': {'symbol': 'VTI', 'isin': 'US9229087690'}}, ctdata.get_many(['VTI', 'BND']))
+        self.assertTrue(os.path.exists(self.cache_file + '.pickle'))
+
+        ctdata.remove('VTI')
+        self.assertEqual(['VXUS'], CachedTickerInfo(self.cache_file, ticker_class=StubTicker).tickers())
+
+    def test_stale_tickers(self):
+        ctdata = CachedTickerInfo(self.cache_file, ticker_class=StubTicker)
+        now = time.time()
+        ctdata.put('NAME', {'longName': 'Fund'}, fetched=now - 100 * DAY)
+        ctdata.put('ER', {'longName': 'Fund', 'annualReportExpenseRatio': 0.04}, fetched=now - 100 * DAY)
+        ctdata.put('OLD', {'longName': 'Fund'}, fetched=now - 400 * DAY)
+        ctdata.put('PINNED', {'longName': 'Fund'}, fetched=now - 400 * DAY)
+        ctdata.set_ttl('PINNED', 1000)
+        ctdata.put('FRESH', {'bondPosition': 0.5}, fetched=now - 1 * DAY)
+        self.assertEqual(['ER', 'OLD'], ctdata.stale_tickers(now=now))
+
+        # refetching a stale ticker makes it fresh again, and keeps its ttl
+        StubTicker.failures = {}
+        self.assertEqual({}, ctdata.batch_lookup(['ER', 'PINNED'], rate=0, progress=False, refetch=True))
+        self.assertEqual(['OLD'], ctdata.stale_tickers())
+        self.assertEqual([], ctdata.stale_tickers(now=now + 999 * DAY, field_ttls={}, default_ttl=10000))
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import datetime
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '.'))
+from beancount import loader
+from beancount.core import getters
+from beancount.utils import test_utils
+from beancount.core.number import D
+import lightloader
+
+
+class TestReadPrices(test_utils.TestCase):
+    @test_utils.docfile
+    def test_read_prices(self, f):
+        """
+        option "operating_currency" "USD"
+        ; a comment
+        2024-01-02 price VTI 230.10 USD
+        2024-01-03 price VTI 1,231.5 USD  ; trailing comment
+        2024-01-03 commodity VTI
+        2024-01-04 price VTSAX 100 USD
+        """
+        prices = list(lightloader.read_prices(f))
+        self.assertEqual([(datetime.date(2024, 1, 2), 'VTI', D('230.10'), 'USD'),
+                          (datetime.date(2024, 1, 3), 'VTI', D('1231.5'), 'USD'),
+                          (datetime.date(2024, 1, 4), 'VTSAX', D('100'), 'USD')], prices)
+
+        prices = list(lightloader.read_prices(f, since=datetime.date(2024, 1, 3)))
+        self.assertEqual(2, len(prices))
+
+    @test_utils.docfile
+    def test_unparseable_price(self, f):
+        """
+        2024-01-02 price VTI (200 + 30) USD
+        """
+        with self.assertRaises(ValueError):
+            list(lightloader.read_prices(f))
+
+
+class TestReadCommodities(test_utils.TestCase):
+    @test_utils.docfile
+    def test_same_as_full_loader(self, f):
+        """
+        option "operating_currency" "USD"
+        2005-01-01 commodity VTI  ; comment
+          a__equivalents: "VTSAX"
+          a__annualReportExpenseRatio: 0.03
+          archive: TRUE
+          since: 2020-01-01
+          price: USD
+          ; indented comment
+          asset_allocation_equity: 100
+
+        2004-01-01 commodity VTSAX
+        2024-01-02 price VTI 230.10 USD
+        2005-01-01 commodity AAA
+          name: "Triple; A"
+        """
+        entries, _, _ = loader.load_file(f)
+        self.assertEqual(list(getters.get_commodity_directives(entries).items()),
+                         list(lightloader.read_commodities(f).items()))
+
+    @test_utils.docfile
+    def test_fallback(self, f):
+        """
+        2005-01-01 commodity VTI
+          name: "Escaped \\"quotes\\""
+        """
+        with self.assertRaises(ValueError):
+            lightloader.read_commodities(f)
+        self.assertEqual('Escaped "quotes"', lightloader.load_commodities(f)['VTI'].meta['name'])
@@ -171,3 +171,27 @@ class TestRelateTickers(test_utils.TestCase):
         expected_value = {k: sorted(v) for k, v in expected_value.items()}
         retval = {k: sorted(v) for k, v in retval.items()}
         self.assertDictEqual(retval, expected_value)
+
+    @test_utils.docfile
+    def test_groups_merged_by_bridge(self, f):
+        """
+        2005-01-01 commodity VOO
+          a__substidenticals: "IVV"
+
+        2005-01-01 commodity VTI
+          a__substidenticals: "ITOT"
+
+        2005-01-01 commodity SPY
+          a__substidenticals: "VOO,VTI"
+
+        2005-01-01 commodity BND
+        """
+        tickerrel = RelateTickers(f)
+        retval = tickerrel.build_commodity_groups(['a__substidenticals'])
+
+        self.assertEqual(1, len(retval))
+        self.assertSetEqual(retval[0], set(['VOO', 'IVV', 'VTI', 'ITOT', 'SPY']))
+
+        reps = set(tickerrel.representative(['VOO', 'IVV', 'VTI', 'ITOT', 'SPY']))
+        self.assertEqual(1, len(reps))
+        self.assertEqual('BND', tickerrel.representative('BND'))
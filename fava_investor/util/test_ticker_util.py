@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+import datetime
+import sys
+import os
+import subprocess
+import tempfile
+import unittest
+sys.path.append(os.path.join(os.path.dirname(__file__), '.'))
+from beancount import loader
+from beancount.core import data, getters
+from beancount.utils import test_utils
+from ticker_util import rewrite_declarations
+from cachedtickerinfo import CachedTickerInfo
+
+
+class TestRewriteDeclarations(test_utils.TestCase):
+    @test_utils.docfile
+    def test_only_changed_rewritten(self, f):
+        """
+        ; hand written comment
+        2005-01-01 commodity VTI
+          name:   "Vanguard Total"
+
+        2005-01-01 commodity VXUS
+          name:   "Vanguard Intl"
+        """
+        entries, _, _ = loader.load_file(f)
+        commodities = getters.get_commodity_directives(entries)
+        commodities['VXUS'].meta['a__quoteType'] = 'ETF'
+        new = data.Commodity({}, commodities['VTI'].date, 'VTSAX')
+
+        with open(f) as fin:
+            lines = fin.readlines()
+        result = ''.join(rewrite_declarations(lines, f, [commodities['VXUS'], new]))
+        self.assertIn('  name:   "Vanguard Total"\n', result)  # unchanged declarations keep their formatting
+        self.assertLines("""
+        ; hand written comment
+        2005-01-01 commodity VTI
+          name:   "Vanguard Total"
+
+        2005-01-01 commodity VTSAX
+
+        2005-01-01 commodity VXUS
+          name: "Vanguard Intl"
+          a__quoteType: "ETF"
+        """, result)
+
+    @test_utils.docfile
+    def test_new_declaration_above_comments(self, f):
+        """
+        ; Generated by: ticker_util.py
+        2005-01-01 commodity VTI
+
+        ; international
+        2005-01-01 commodity VXUS
+        """
+        new = [data.Commodity({}, datetime.date(2005, 1, 1), c) for c in ['AAA', 'VTSAX']]
+        with open(f) as fin:
+            lines = fin.readlines()
+        self.assertLines("""
+        ; Generated by: ticker_util.py
+        2005-01-01 commodity AAA
+
+        2005-01-01 commodity VTI
+
+        2005-01-01 commodity VTSAX
+
+        ; international
+        2005-01-01 commodity VXUS
+        """, ''.join(rewrite_declarations(lines, f, new)))
+
+    def test_included_declarations_not_duplicated(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            main = os.path.join(tmpdir, 'main.beancount')
+            with open(main, 'w') as f:
+                f.write('include "etfs.beancount"\n2005-01-01 commodity VXUS\n')
+            with open(os.path.join(tmpdir, 'etfs.beancount'), 'w') as f:
+                f.write('2005-01-01 commodity VTI\n')
+            entries, _, _ = loader.load_file(main)
+            commodities = getters.get_commodity_directives(entries)
+            commodities['VTI'].meta['a__quoteType'] = 'ETF'
+
+            with open(main) as fin:
+                lines = fin.readlines()
+            self.assertEqual(lines, rewrite_declarations(lines, main, [commodities['VTI']]))
+
+
+class TestGenCommoditiesFile(unittest.TestCase):
+    declarations = """
+2005-01-01 commodity VTI
+  a__tlh_partners: "VOO"
+  a__substidenticals: "ITOT"
+
+2005-01-01 commodity ITOT
+
+2005-01-01 commodity VOO
+  a__substidenticals: "IVV"
+
+2005-01-01 commodity IVV
+"""
+
+    def gen(self, tmpdir, cf, hashseed, *args):
+        """Run gen-commodities-file in a fresh interpreter, since set ordering varies with the hash seed"""
+        env = dict(os.environ, BEAN_ROOT=tmpdir, PYTHONHASHSEED=str(hashseed))
+        return subprocess.run([sys.executable, '-m', 'fava_investor.util.ticker_util', 'gen-commodities-file',
+                               '--cf', cf] + list(args), env=env, capture_output=True, text=True, check=True,
+                              cwd=os.path.join(os.path.dirname(__file__), '..', '..'))
+
+    def test_regenerating_changes_nothing(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cf = os.path.join(tmpdir, 'commodities.beancount')
+            with open(cf, 'w') as f:
+                f.write(self.declarations)
+            ctdata = CachedTickerInfo(os.path.join(tmpdir, '.ticker_info.yahoo.cache'))
+            for ticker in ['VTI', 'ITOT', 'VOO', 'IVV']:
+                ctdata.put(ticker, {'quoteType': 'ETF'})
+
+            self.gen(tmpdir, cf, 0, '--write-file', '--confirm-overwrite')
+            for hashseed in range(1, 5):
+                result = self.gen(tmpdir, cf, hashseed, '--incremental', '--patch')
+                self.assertEqual('', result.stdout)
+                self.assertIn('0 declaration(s) changed', result.stderr)
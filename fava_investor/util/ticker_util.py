@@ -4,7 +4,10 @@
 import click
 from click_aliases import ClickAliasedGroup
 import datetime
+import difflib
+import io
 import os
+import re
 import sys
 
 from beancount.core import data
@@ -16,6 +19,25 @@ cf_help = """Beancount commodity declarations file. This can alternatively be sp
 the BEAN_COMMODITIES_FILE environment variable."""
 cf_option = click.option('--cf', help=cf_help, envvar='BEAN_COMMODITIES_FILE',
                          type=click.Path(exists=True))
+
+
+def download_options(f):
+    """Options that control downloads, shared by the commands that download"""
+    f = click.option('-j', '--jobs', default=8, show_default=True,
+                     help='Number of tickers to download concurrently')(f)
+    f = click.option('--rate', default=4.0, show_default=True,
+                     help='Most downloads to start per second (0: no limit)')(f)
+    f = click.option('--retries', default=3, show_default=True,
+                     help='Times to retry a failed download, waiting exponentially longer each time')(f)
+    return f
+
+
+def report_failed(failed):
+    if failed:
+        print(f"Failed to download {len(failed)} ticker(s):", ','.join(sorted(failed)), file=sys.stderr)
+        sys.exit(1)
+
+
 bean_root = os.getenv('BEAN_ROOT', '~/')
 yf_cache = os.path.expanduser(os.sep.join([bean_root, '.ticker_info.yahoo.cache']))
 
@@ -31,7 +53,7 @@ def cli():
 
     """In all subcommands, the following environment variables are used:
 \n$BEAN_ROOT: root directory for beancount source(s). Downloaded info is cached in this directory
-in a file named .ticker_info.yahoo.cache. Default: ~
+in a SQLite database named .ticker_info.yahoo.cache. Default: ~
 \n$BEAN_COMMODITIES_FILE: file with beancount commodities declarations. WARNING: the 'comm' subcommand
 will overwrite this file when requested
     """
@@ -50,10 +72,12 @@ def relate():
 @click.option('--from-file', is_flag=True, help="Add tickers declared in beancount commodity declarations "
               "file (specify the file separately)")
 @cf_option
-def ticker_add(tickers, from_file, cf):
+@download_options
+def ticker_add(tickers, from_file, cf, jobs, rate, retries):
     """Download and add new tickers to database. Accepts a list of comma separated tickers, or alternatively,
     adds all tickers declared in the specified beancount file. The latter is useful for the very first time
-    you run this utility."""
+    you run this utility. Tickers that fail to download are listed at the end: simply rerun to retry them,
+    since tickers already in the database are skipped."""
 
     if from_file:
         tickerrel = RelateTickers(cf)
@@ -65,8 +89,49 @@ def ticker_add(tickers, from_file, cf):
         return
 
     ctdata = CachedTickerInfo(yf_cache)
-    ctdata.batch_lookup(tickers)
-    ctdata.write_cache()
+    failed = ctdata.batch_lookup(tickers, concurrency=jobs, rate=rate, retries=retries)
+    report_failed(failed)
+
+
+@cli.command(aliases=['refresh'])
+@click.option('--stale', is_flag=True, help='Refresh tickers whose info has expired')
+@click.option('--tickers', default='', help='Comma-separated list of tickers to refresh regardless of age')
+@click.option('-n', '--dry-run', is_flag=True, help='List the tickers that would be refreshed, and exit')
+@download_options
+def ticker_refresh(stale, tickers, dry_run, jobs, rate, retries):
+    """Download info again for tickers already in the database. With --stale, only tickers whose info has
+    expired are downloaded. Info expires after a number of days that depends on the fields it has: eg: expense
+    ratios and asset allocations (bondPosition, etc.) expire sooner than names. A ticker that fails to
+    download keeps its existing info. Use 'ttl' to set how long specific tickers stay fresh."""
+
+    if not stale and not tickers:
+        print("Specify --stale, or tickers to refresh.", file=sys.stderr)
+        return
+    ctdata = CachedTickerInfo(yf_cache)
+    to_refresh = ctdata.stale_tickers() if stale else []
+    to_refresh += [t for t in tickers.split(',') if t and t in ctdata]
+    if dry_run:
+        print(','.join(to_refresh))
+        return
+
+    print(f"Refreshing {len(to_refresh)} of {len(ctdata)} tickers", file=sys.stderr)
+    failed = ctdata.batch_lookup(to_refresh, concurrency=jobs, rate=rate, retries=retries, refetch=True)
+    report_failed(failed)
+
+
+@cli.command(aliases=['ttl'])
+@click.option('--tickers', default='', help='Comma-separated list of tickers')
+@click.option('--days', type=float, help='Days after which these tickers go stale, regardless of their fields')
+@click.option('--reset', is_flag=True, help='Revert to the default, per field expiry')
+def ticker_ttl(tickers, days, reset):
+    """Set how long info for specific tickers stays fresh (see 'refresh --stale')."""
+    if days is None and not reset:
+        print("Specify --days or --reset.", file=sys.stderr)
+        return
+    ctdata = CachedTickerInfo(yf_cache)
+    for t in tickers.split(','):
+        if t:
+            ctdata.set_ttl(t, None if reset else days)
 
 
 @cli.command(aliases=['remove'])
@@ -104,8 +169,7 @@ def ticker_list(info, available_keys, explore):
         lines.append(header_line.format(
             *['_' * (width if width else 40) for _, _, _, width in interesting]))
 
-        for ticker in sorted(ctdata.data):
-            info = ctdata.data[ticker]
+        for ticker, info in ctdata.items():
             line = ''
             for _, k, fmt, width in interesting:
                 try:
@@ -117,15 +181,15 @@ def ticker_list(info, available_keys, explore):
         click.echo_via_pager('\n'.join(lines))
     elif available_keys:
         lines = []
-        for k, v in ctdata.data.items():
+        for k, v in ctdata.items():
             lines.append(k)
             lines.append('\n '.join([i for i in v]))
         click.echo_via_pager('\n'.join(lines))
     else:
-        print(','.join(ctdata.data.keys()))
+        print(','.join(ctdata.tickers()))
 
     if explore:
-        print("Hint: use ctdata and ctdata.data to explore")
+        print("Hint: use ctdata to explore (eg: ctdata.tickers(), ctdata.get(ticker))")
         import pdb
         pdb.set_trace()
 
@@ -147,6 +211,51 @@ def value_transform(val, label):
     return str(val)
 
 
+p_commodity = re.compile(r'^\d{4}-\d{2}-\d{2}\s+commodity\s+(\S+)')
+
+
+def rewrite_declarations(lines, filename, entries):
+    """Replace the declarations of the given commodity entries in lines (the contents of filename), leaving
+    all other lines as they are. A declaration spans its directive line and the indented (metadata) lines
+    after it. Entries not declared anywhere (eg: new ones) are inserted in sorted order, ahead of the comment
+    lines directly above the declaration they precede. Entries declared in other files (eg: included ones)
+    are left out."""
+    lines = list(lines)
+    path = os.path.abspath(filename)
+
+    def declaration_end(start):
+        end = start + 1
+        while end < len(lines) and lines[end].strip() and lines[end][0] in ' \t':
+            end += 1
+        return end
+
+    def comments_start(start):
+        while start > 0 and lines[start - 1].startswith(';') and not lines[start - 1].startswith('; Generated by:'):
+            start -= 1
+        return start
+
+    declared = [e for e in entries if e.meta.get('filename') and os.path.abspath(e.meta['filename']) == path]
+    # bottom up, so that the line numbers of the remaining entries stay valid
+    for entry in sorted(declared, key=lambda e: e.meta['lineno'], reverse=True):
+        start = entry.meta['lineno'] - 1
+        lines[start:declaration_end(start)] = printer.format_entry(entry).splitlines(keepends=True)
+
+    declared_ids = set(map(id, declared))
+    for entry in entries:
+        if id(entry) in declared_ids or entry.meta.get('filename'):
+            continue
+        if lines and not lines[-1].endswith('\n'):
+            lines[-1] += '\n'
+        new = printer.format_entry(entry).splitlines(keepends=True) + ['\n']
+        after = [i for i, line in enumerate(lines) if (m := p_commodity.match(line)) and m.group(1) > entry.currency]
+        if after:
+            start = comments_start(after[0])
+            lines[start:start] = new
+        else:
+            lines += ['\n'] + new[:-1]
+    return lines
+
+
 metadata_includes = """quoteType,longName,isin,annualReportExpenseRatio,\
 preferredPosition,bondPosition,convertiblePosition,otherPosition,cashPosition,stockPosition"""
 
@@ -165,8 +274,13 @@ preferredPosition,bondPosition,convertiblePosition,otherPosition,cashPosition,st
               "actually overwrite")
 @click.option('-st', '--same-type', is_flag=True, help="Include only partners that are of the "
               "same type (MF, ETF, etc.)")
+@click.option('-i', '--incremental', is_flag=True, help="Rewrite only the declarations whose metadata changed, "
+              "leaving the rest of the file (including comments and formatting) as is. With --write-file, the "
+              "file is left untouched if nothing changed")
+@click.option('--patch', is_flag=True, help="Output the changes --incremental would make as a unified diff, "
+              "instead of the whole file")
 def gen_commodities_file(cf, prefix, metadata, appends, include_undeclared, write_file,  # noqa: C901
-                         confirm_overwrite, same_type):
+                         confirm_overwrite, same_type, incremental, patch):
     """Generate Beancount commodity declarations with metadata from database, and existing declarations."""
 
     auto_metadata = metadata.split(',')
@@ -176,8 +290,9 @@ def gen_commodities_file(cf, prefix, metadata, appends, include_undeclared, writ
     commodities = tickerrel.db
     full_tlh_db = tickerrel.compute_tlh_groups(same_type)
     ctdata = CachedTickerInfo(yf_cache)
+    original_meta = {c: dict(entry.meta) for c, entry in commodities.items()}
 
-    not_in_commodities_file = [c for c in ctdata.data if c not in commodities]
+    not_in_commodities_file = [c for c in ctdata.tickers() if c not in commodities]
     if not_in_commodities_file:
         if include_undeclared:
             for c in not_in_commodities_file:
@@ -190,8 +305,10 @@ def gen_commodities_file(cf, prefix, metadata, appends, include_undeclared, writ
                   file=sys.stderr)
 
     # update a_* metadata
+    ticker_info = ctdata.get_many(commodities)
     for c, metadata in commodities.items():
-        if c in ctdata.data:
+        if c in ticker_info:
+            info = ticker_info[c]
             if tickerrel.substidenticals(c, equivalents_only=True):
                 metadata.meta[prefix + 'equivalents'] = ','.join(tickerrel.substidenticals(c, equivalents_only=True))
             if tickerrel.substidenticals(c):
@@ -199,24 +316,47 @@ def gen_commodities_file(cf, prefix, metadata, appends, include_undeclared, writ
             if c in full_tlh_db:
                 metadata.meta[prefix + 'tlh_partners'] = ','.join(full_tlh_db[c])
             for m in auto_metadata:
-                if m in ctdata.data[c] and ctdata.data[c][m]:
+                if m in info and info[m]:
                     if m in auto_metadata_appends:
                         mdval = set(metadata.meta.get(prefix + m, '').split(','))
                         mdval = set() if mdval == set(['']) else mdval
-                        mdval.add(str(ctdata.data[c][m]))
+                        mdval.add(str(info[m]))
                         metadata.meta[prefix + m] = ','.join(sorted(list(mdval)))
                     else:
                         label = label_transform(m, prefix)
-                        value = value_transform(ctdata.data[c][m], m)
+                        value = value_transform(info[m], m)
                         metadata.meta[label] = value
-    cv = list(commodities.values())
-    cv.sort(key=lambda x: x.currency)
+    header = f"; Generated by: {os.path.basename(__file__)}, at {datetime.datetime.today().isoformat()}\n"
+    if incremental or patch:
+        changed = [e for c, e in sorted(commodities.items()) if e.meta != original_meta.get(c)]
+        elsewhere = [e.currency for e in changed
+                     if e.meta.get('filename') and os.path.abspath(e.meta['filename']) != os.path.abspath(cf)]
+        if elsewhere:
+            raise click.ClickException(f"{', '.join(elsewhere)} changed, but are declared in files included by "
+                                       f"{cf}, which --incremental does not rewrite. Run without --incremental, or "
+                                       "on the included files")
+        with open(cf) as f:
+            old_lines = f.readlines()
+        new_lines = rewrite_declarations(old_lines, cf, changed)
+        if changed and new_lines and new_lines[0].startswith('; Generated by:'):
+            new_lines[0] = header
+        print(f"{len(changed)} declaration(s) changed:", ','.join(e.currency for e in changed), file=sys.stderr)
+
+        if patch:
+            sys.stdout.writelines(difflib.unified_diff(old_lines, new_lines, cf, cf))
+            return
+        if write_file and confirm_overwrite and not changed:
+            return
+        output = ''.join(new_lines)
+    else:
+        cv = list(commodities.values())
+        cv.sort(key=lambda x: x.currency)
+        oss = io.StringIO()
+        printer.print_entries(cv, file=oss)
+        output = header + oss.getvalue()
 
     with open(cf, "w") if write_file and confirm_overwrite else sys.stdout as fout:
-        print(f"; Generated by: {os.path.basename(__file__)}, at {datetime.datetime.today().isoformat()}",
-              file=fout)
-        fout.flush()
-        printer.print_entries(cv, file=fout)
+        fout.write(output)
 
     if write_file and not confirm_overwrite:
         print(